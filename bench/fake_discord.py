@@ -0,0 +1,218 @@
+"""
+A local stand-in for the parts of Discord's HTTP API the relay calls.
+
+Webhooks are rate limited per webhook like the real thing and answer with the same
+``X-RateLimit-*`` headers and 429 bodies, so the bot's own rate limit handling is exercised.
+"""
+import json
+import re
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+from bench.fakes import Snowflakes
+
+MARKER = re.compile(r'msg-(\d+)')
+
+
+def json_response(data, *, status=200, headers=None) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly application/json, no charset
+    headers = {**(headers or {}), 'Content-Type': 'application/json'}
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=headers)
+
+
+class FakeDiscord:
+
+    def __init__(self, snowflakes: Snowflakes, *, limit=5, window=2.0):
+        self.snowflakes = snowflakes
+        self.limit = limit
+        self.window = window
+        self.webhook_channels: dict[int, int] = {}
+        self.user = {'id': '1', 'username': 'Wormhole', 'discriminator': '0', 'avatar': None, 'bot': True}
+        self.calls = Counter()
+        self.rate_limited = 0
+        # (marker, channel id) -> when it first showed up in that channel
+        self.arrivals: dict[tuple[int, int], float] = {}
+        self._buckets: dict[int, list] = {}
+        self._runner = None
+
+    def add_webhook(self, webhook):
+        self.webhook_channels[webhook.id] = webhook.channel_id
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/api/webhooks/{webhook_id}/{token}', self.execute)
+        app.router.add_patch('/api/webhooks/{webhook_id}/{token}/messages/{message_id}', self.edit)
+        app.router.add_delete('/api/webhooks/{webhook_id}/{token}/messages/{message_id}', self.delete)
+        app.router.add_get('/api/users/@me', self.get_user)
+        app.router.add_get('/api/oauth2/applications/@me', self.get_application)
+        app.router.add_get('/api/channels/{channel_id}/webhooks', self.get_webhooks)
+        app.router.add_post('/api/channels/{channel_id}/webhooks', self.create_webhook)
+        app.router.add_route('*', '/api/channels/{tail:.*}', self.channel_call)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0) -> str:
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return 'http://{0}:{1}/api'.format(host, port)
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _take(self, webhook_id: int):
+        now = time.monotonic()
+        bucket = self._buckets.get(webhook_id)
+        if bucket is None or now >= bucket[0] + self.window:
+            bucket = self._buckets[webhook_id] = [now, 0]
+        reset_after = bucket[0] + self.window - now
+        if bucket[1] >= self.limit:
+            return False, reset_after, 0
+        bucket[1] += 1
+        return True, reset_after, self.limit - bucket[1]
+
+    def _limited(self, webhook_id: int, kind: str):
+        self.calls[kind] += 1
+        allowed, reset_after, remaining = self._take(webhook_id)
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset-After': '{0:.3f}'.format(reset_after),
+            'X-RateLimit-Bucket': str(webhook_id),
+        }
+        if allowed:
+            return None, headers
+        self.rate_limited += 1
+        body = {'message': 'You are being rate limited.', 'retry_after': round(reset_after, 3), 'global': False}
+        return json_response(body, status=429, headers={**headers, 'Retry-After': str(reset_after)}), headers
+
+    @staticmethod
+    async def _payload(request: web.Request) -> dict:
+        if request.content_type.startswith('multipart'):
+            form = await request.post()
+            return json.loads(form['payload_json'])
+        return await request.json()
+
+    def _record(self, payload: dict, channel_id: int):
+        now = time.monotonic()
+        text = [payload.get('content') or '']
+        text.extend(embed.get('description', '') for embed in payload.get('embeds', ()))
+        for marker in MARKER.findall('\n'.join(text)):
+            self.arrivals.setdefault((int(marker), channel_id), now)
+
+    async def execute(self, request: web.Request):
+        webhook_id = int(request.match_info['webhook_id'])
+        limited, headers = self._limited(webhook_id, 'webhook_execute')
+        if limited is not None:
+            return limited
+        channel_id = int(request.query.get('thread_id', self.webhook_channels.get(webhook_id, 0)))
+        self._record(await self._payload(request), channel_id)
+        data = {'id': str(self.snowflakes()), 'channel_id': str(channel_id), 'webhook_id': str(webhook_id)}
+        return json_response(data, headers=headers)
+
+    async def edit(self, request: web.Request):
+        webhook_id = int(request.match_info['webhook_id'])
+        limited, headers = self._limited(webhook_id, 'webhook_edit')
+        if limited is not None:
+            return limited
+        channel_id = self.webhook_channels.get(webhook_id, 0)
+        await self._payload(request)
+        data = {'id': request.match_info['message_id'], 'channel_id': str(channel_id), 'webhook_id': str(webhook_id)}
+        return json_response(data, headers=headers)
+
+    async def delete(self, request: web.Request):
+        webhook_id = int(request.match_info['webhook_id'])
+        limited, headers = self._limited(webhook_id, 'webhook_delete')
+        if limited is not None:
+            return limited
+        return web.Response(status=204, headers=headers)
+
+    async def get_user(self, request: web.Request):
+        return json_response(self.user)
+
+    async def get_application(self, request: web.Request):
+        return json_response({
+            'id': self.user['id'],
+            'name': self.user['username'],
+            'description': '',
+            'icon': None,
+            'bot_public': False,
+            'bot_require_code_grant': False,
+            'owner': self.user,
+            'verify_key': '',
+            'flags': 0,
+        })
+
+    def _webhook_payload(self, webhook_id: int, channel_id: int) -> dict:
+        return {
+            'id': str(webhook_id),
+            'type': 1,
+            'token': 'token-{0}'.format(webhook_id),
+            'name': 'Wormhole Sender',
+            'avatar': None,
+            'channel_id': str(channel_id),
+        }
+
+    async def get_webhooks(self, request: web.Request):
+        self.calls['webhooks_get'] += 1
+        channel_id = int(request.match_info['channel_id'])
+        return json_response([
+            self._webhook_payload(webhook_id, channel_id) for webhook_id, channel in self.webhook_channels.items() if channel == channel_id
+        ])
+
+    async def create_webhook(self, request: web.Request):
+        self.calls['webhooks_create'] += 1
+        channel_id = int(request.match_info['channel_id'])
+        webhook_id = self.snowflakes()
+        self.webhook_channels[webhook_id] = channel_id
+        return json_response(self._webhook_payload(webhook_id, channel_id))
+
+    async def channel_call(self, request: web.Request):
+        kind = 'reaction' if '/reactions' in request.path else 'message'
+        self.calls['{0}_{1}'.format(kind, request.method.lower())] += 1
+        if request.method == 'GET':
+            # Nothing outside the trace exists
+            return json_response({'message': 'Unknown Message', 'code': 10008}, status=404)
+        return web.Response(status=204)
+
+
+class FakeHTTP:
+    """Plays the part of discord.py's HTTP client for the non-webhook calls the cogs make."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._session = aiohttp.ClientSession()
+
+    async def close(self):
+        await self._session.close()
+
+    async def _call(self, method, path):
+        async with self._session.request(method, self.base_url + path) as response:
+            await response.read()
+
+    async def add_reaction(self, channel_id, message_id, emoji):
+        await self._call('PUT', '/channels/{0}/messages/{1}/reactions/{2}/@me'.format(channel_id, message_id, emoji))
+
+    async def remove_own_reaction(self, channel_id, message_id, emoji):
+        await self._call('DELETE', '/channels/{0}/messages/{1}/reactions/{2}/@me'.format(channel_id, message_id, emoji))
+
+    async def remove_reaction(self, channel_id, message_id, emoji, member_id):
+        await self._call('DELETE', '/channels/{0}/messages/{1}/reactions/{2}/{3}'.format(channel_id, message_id, emoji, member_id))
+
+    async def clear_single_reaction(self, channel_id, message_id, emoji):
+        await self._call('DELETE', '/channels/{0}/messages/{1}/reactions/{2}'.format(channel_id, message_id, emoji))
+
+    async def clear_reactions(self, channel_id, message_id):
+        await self._call('DELETE', '/channels/{0}/messages/{1}/reactions'.format(channel_id, message_id))
+
+    async def delete_message(self, channel_id, message_id, *, reason=None):
+        await self._call('DELETE', '/channels/{0}/messages/{1}'.format(channel_id, message_id))
@@ -0,0 +1,273 @@
+"""
+Synthetic stand-ins for the discord.py models the relay touches.
+
+They only carry the attributes and coroutines the bot actually uses, which keeps them cheap enough
+to build by the hundred thousand for benchmarks while still going through the real bot code.
+"""
+import datetime
+import itertools
+import random
+import types
+
+import discord
+
+
+def not_found():
+    return discord.NotFound(types.SimpleNamespace(status=404, reason='Not Found'), {'message': 'Unknown', 'code': 10008})
+
+
+class Snowflakes:
+
+    def __init__(self, start: datetime.datetime = None):
+        self.base = discord.utils.time_snowflake(start or datetime.datetime.now(datetime.timezone.utc))
+        self._counter = itertools.count(1)
+
+    def __call__(self) -> int:
+        return self.base + next(self._counter)
+
+
+class FakeState:
+
+    def __init__(self, http=None):
+        self.http = http
+
+
+class FakeUser:
+
+    def __init__(self, user_id: int, name: str, *, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.display_avatar = types.SimpleNamespace(url='https://cdn.discordapp.com/embed/avatars/{0}.png'.format(user_id % 5))
+        self.mention = '<@{0}>'.format(user_id)
+        self.dm_channel = None
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '<FakeUser id={0}>'.format(self.id)
+
+    async def create_dm(self):
+        self.dm_channel = FakeDM()
+        return self.dm_channel
+
+
+class FakeDM:
+
+    async def send(self, *args, **kwargs):
+        return None
+
+
+class FakeRole:
+
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+
+class FakeGuild:
+
+    def __init__(self, guild_id: int, name: str, *, filesize_limit=25 * 1024 * 1024):
+        self.id = guild_id
+        self.name = name
+        self.filesize_limit = filesize_limit
+        self.members: dict[int, FakeUser] = {}
+        self.roles: dict[int, FakeRole] = {}
+        self.channels: dict[int, 'FakeChannel'] = {}
+        self.member_count = 0
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return '<FakeGuild id={0}>'.format(self.id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def _resolve_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_ban(self, user):
+        raise not_found()
+
+
+class FakeWebhook:
+
+    def __init__(self, webhook_id: int, token: str, name: str, channel_id: int):
+        self.id = webhook_id
+        self.token = token
+        self.name = name
+        self.channel_id = channel_id
+
+
+class FakeChannel:
+
+    type = discord.ChannelType.text
+
+    def __init__(self, channel_id: int, name: str, guild: FakeGuild, *, state: FakeState = None, snowflakes: Snowflakes = None, on_webhook=None):
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+        self._state = state or FakeState()
+        self.mention = '<#{0}>'.format(channel_id)
+        self.messages: dict[int, 'FakeMessage'] = {}
+        self._webhooks: list[FakeWebhook] = []
+        self._snowflakes = snowflakes or Snowflakes()
+        self._on_webhook = on_webhook
+        guild.channels[channel_id] = self
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        # The bot's caches key on repr, so this has to tell channels apart
+        return '<FakeChannel id={0}>'.format(self.id)
+
+    async def webhooks(self):
+        return list(self._webhooks)
+
+    async def create_webhook(self, *, name):
+        webhook = FakeWebhook(self._snowflakes(), 'token-{0}'.format(self.id), name, self.id)
+        self._webhooks.append(webhook)
+        if self._on_webhook is not None:
+            self._on_webhook(webhook)
+        return webhook
+
+    def get_partial_message(self, message_id):
+        return discord.PartialMessage(channel=self, id=message_id)
+
+    async def fetch_message(self, message_id):
+        message = self.messages.get(message_id)
+        if message is None:
+            raise not_found()
+        return message
+
+    async def typing(self):
+        return None
+
+
+class FakeAttachment:
+
+    def __init__(self, attachment_id: int, filename: str, size: int):
+        self.id = attachment_id
+        self.filename = filename
+        self.size = size
+        self.url = 'https://cdn.discordapp.com/attachments/{0}/{1}'.format(attachment_id, filename)
+        self.description = None
+
+    def is_spoiler(self):
+        return False
+
+    async def read(self):
+        return bytes(self.size)
+
+
+class FakeReference:
+
+    def __init__(self, message: 'FakeMessage'):
+        self.message_id = message.id
+        self.cached_message = message
+
+
+class FakeMessage:
+
+    def __init__(
+            self,
+            message_id: int,
+            channel: FakeChannel,
+            author: FakeUser,
+            content: str,
+            *,
+            attachments=None,
+            reply_to: 'FakeMessage' = None,
+            mentions=None,
+            role_mentions=None,
+    ):
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.attachments = attachments or []
+        self.embeds = []
+        self.mentions = mentions or []
+        self.role_mentions = role_mentions or []
+        self.reference = FakeReference(reply_to) if reply_to is not None else None
+        self.webhook_id = None
+        self.created_at = discord.utils.snowflake_time(message_id)
+        channel.messages[message_id] = self
+
+    @property
+    def jump_url(self):
+        return 'https://discord.com/channels/{0}/{1}/{2}'.format(self.guild.id, self.channel.id, self.id)
+
+
+def make_guild(snowflakes: Snowflakes, *, members=50, roles=10, channels=5, state: FakeState = None, on_webhook=None) -> FakeGuild:
+    guild = FakeGuild(snowflakes(), 'guild')
+    for index in range(members):
+        user = FakeUser(snowflakes(), 'member-{0}'.format(index))
+        guild.members[user.id] = user
+    guild.member_count = members
+    for index in range(roles):
+        role = FakeRole(snowflakes(), 'role-{0}'.format(index))
+        guild.roles[role.id] = role
+    for index in range(channels):
+        FakeChannel(snowflakes(), 'channel-{0}'.format(index), guild, state=state, snowflakes=snowflakes, on_webhook=on_webhook)
+    return guild
+
+
+def mention_content(guild: FakeGuild, rng: random.Random, *, words=40, mentions=10) -> str:
+    """Message text with user, role and channel mentions mixed into plain words."""
+    members = list(guild.members)
+    roles = list(guild.roles)
+    channels = list(guild.channels)
+    parts = ['word{0}'.format(rng.randrange(1000)) for _ in range(words)]
+    for _ in range(mentions):
+        kind = rng.randrange(3)
+        if kind == 0:
+            token = '<@{0}>'.format(rng.choice(members))
+        elif kind == 1:
+            token = '<@&{0}>'.format(rng.choice(roles))
+        else:
+            token = '<#{0}>'.format(rng.choice(channels))
+        parts.insert(rng.randrange(len(parts) + 1), token)
+    return ' '.join(parts)
+
+
+def make_history(
+        snowflakes: Snowflakes,
+        channel: FakeChannel,
+        count: int,
+        rng: random.Random,
+        *,
+        authors=8,
+        reply_ratio=0.2,
+        attachment_ratio=0.05,
+        chain=False,
+) -> list[FakeMessage]:
+    """A channel history, oldest first.
+
+    With ``chain`` every message replies to the one before it, for the worst case reply depth.
+    Otherwise ``reply_ratio`` of messages reply to a random earlier message.
+    """
+    users = list(channel.guild.members.values())[:authors]
+    history: list[FakeMessage] = []
+    for index in range(count):
+        reply_to = None
+        if history and (chain or rng.random() < reply_ratio):
+            reply_to = history[-1] if chain else rng.choice(history)
+        attachments = []
+        if rng.random() < attachment_ratio:
+            attachments.append(FakeAttachment(snowflakes(), 'file-{0}.png'.format(index), rng.randrange(1024, 64 * 1024)))
+        content = 'message {0} '.format(index) + 'lorem ipsum ' * rng.randrange(1, 20)
+        history.append(FakeMessage(snowflakes(), channel, rng.choice(users), content, attachments=attachments, reply_to=reply_to))
+    return history
@@ -0,0 +1,219 @@
+"""
+Microbenchmarks for the pure Python helpers that run on every message or history pull.
+
+Inputs are built once from :mod:`bench.fakes` with a fixed seed, so runs on the same machine
+compare. Each benchmark is timed with :mod:`timeit` (garbage collection off) and the best of
+``--repeat`` rounds is reported, which is the figure least disturbed by whatever else the machine
+was doing.
+
+    python -m bench.micro --save bench/baseline.json
+    # change something
+    python -m bench.micro --compare bench/baseline.json --threshold 0.1
+
+With ``--compare`` the exit status is 1 when any benchmark got slower than the threshold allows.
+Baselines are only meaningful on the machine and Python they were recorded with.
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+
+import discord
+
+from bench.fakes import FakeMessage, Snowflakes, make_guild, make_history, mention_content
+from bot.core.embed import Embed
+from bot.util import cache
+from bot.util import reply_graph, webhooker
+from bot.util.clean_content import clean_content
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a setup function. It builds the inputs and returns the callable that gets timed."""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class Inputs:
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.snowflakes = Snowflakes()
+        self.guild = make_guild(self.snowflakes, members=500, roles=50, channels=20)
+        self.channel = next(iter(self.guild.channels.values()))
+        self.author = next(iter(self.guild.members.values()))
+        self._history = None
+        self._chain = None
+
+    @property
+    def history(self) -> list[FakeMessage]:
+        """10k messages with a fifth of them replying somewhere earlier."""
+        if self._history is None:
+            self._history = make_history(self.snowflakes, self.channel, 10_000, self.rng, reply_ratio=0.2)
+        return self._history
+
+    @property
+    def chain(self) -> list[FakeMessage]:
+        """Every message replies to the previous one."""
+        if self._chain is None:
+            self._chain = make_history(self.snowflakes, self.channel, 500, self.rng, chain=True)
+        return self._chain
+
+    def message(self, content: str) -> FakeMessage:
+        return FakeMessage(self.snowflakes(), self.channel, self.author, content)
+
+
+@benchmark('clean_content.plain')
+def bench_clean_plain(inputs: Inputs):
+    message = inputs.message('lorem ipsum dolor sit amet ' * 70)
+    return lambda: clean_content(message)
+
+
+@benchmark('clean_content.mentions')
+def bench_clean_mentions(inputs: Inputs):
+    message = inputs.message(mention_content(inputs.guild, inputs.rng, words=150, mentions=60))
+    return lambda: clean_content(message)
+
+
+@benchmark('cache.create_key')
+def bench_create_key(inputs: Inputs):
+    owner = object()
+
+    def get_link_data(self, link_id):
+        pass
+
+    return lambda: cache.create_key(get_link_data, owner, inputs.channel, 123456789012345678, loose=True)
+
+
+@benchmark('ExpiringDict.1k')
+def bench_expiring_dict(inputs: Inputs):
+    keys = list(range(1000))
+
+    def run():
+        expiring = cache.ExpiringDict(60)
+        for key in keys:
+            expiring[key] = key
+        for key in keys:
+            if key in expiring:
+                expiring[key]  # noqa: B018
+    return run
+
+
+@benchmark('Webhooker.flatten.10k')
+def bench_flatten(inputs: Inputs):
+    history = inputs.history
+    return lambda: webhooker.Webhooker.flatten(history)
+
+
+@benchmark('build_dict.10k')
+def bench_build_dict(inputs: Inputs):
+    history = inputs.history
+    return lambda: webhooker.build_dict(history)
+
+
+@benchmark('build_dict.chain')
+def bench_build_dict_chain(inputs: Inputs):
+    chain = inputs.chain
+    return lambda: webhooker.build_dict(chain)
+
+
+@benchmark('get_first_referenced.chain')
+def bench_first_referenced(inputs: Inputs):
+    chain = inputs.chain
+    pairs = webhooker.build_dict(chain)
+    return lambda: webhooker.get_first_referenced(chain[-1].id, pairs)
+
+
+@benchmark('extend_all.chain')
+def bench_extend_all(inputs: Inputs):
+    chain = inputs.chain
+    pairs = webhooker.build_dict(chain)
+    return lambda: webhooker.extend_all(chain[0].id, pairs, [chain[0]])
+
+
+@benchmark('ReplyGraph.conversation.10k')
+def bench_conversation(inputs: Inputs):
+    history = inputs.history
+    return lambda: reply_graph.ReplyGraph.from_messages(history).conversation(history[-1].id)
+
+
+@benchmark('Embed.set_description')
+def bench_embed_description(inputs: Inputs):
+    description = 'lorem ipsum dolor sit amet ' * 150
+    embed = Embed(truncate_append='…')
+    return lambda: embed.set_description(description)
+
+
+@benchmark('Embed.to_dict')
+def bench_embed_to_dict(inputs: Inputs):
+    embed = Embed(title='Digest', description='lorem ipsum dolor sit amet ' * 150, colour=discord.Colour.blurple())
+    embed.set_author(name='Wormhole', icon_url='https://cdn.discordapp.com/embed/avatars/0.png')
+    embed.set_footer(text='3 more messages were not shown')
+    for index in range(10):
+        embed.add_field(name='field {0}'.format(index), value='value ' * 20, inline=False)
+    return embed.to_dict
+
+
+def measure(func, repeat: int, min_time: float) -> float:
+    """Best seconds per call."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / elapsed))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{0:.3g} {1}'.format(seconds / scale, unit)
+    return '{0:.3g} ns'.format(seconds / 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks containing this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds each round should take at least')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='FILE', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown, 0.1 is 10%%')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+
+    inputs = Inputs(args.seed)
+    results = {}
+    regressions = []
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = seconds = measure(setup(inputs), args.repeat, args.min_time)
+        line = '{0:<30} {1:>10}'.format(name, format_time(seconds))
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += '  {0:+.1%}'.format(change)
+            if change > args.threshold:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python': sys.version, 'results': results}, file, indent=2)
+
+    if regressions:
+        print('{0} benchmark(s) slower than the {1:.0%} threshold: {2}'.format(len(regressions), args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Offline end-to-end load test for the live relay.
+
+Synthetic traffic is pushed through ``Link.on_message`` and the raw reaction, edit and delete
+listeners exactly as the gateway would dispatch it. Webhook and REST calls go to
+:mod:`bench.fake_discord` and the database is a real local PostgreSQL, so the numbers include real
+queries and rate limit handling but no network or Discord.
+
+    python -m bench.relay --dsn postgresql://localhost/wormhole_bench --channels 10 --rate 20 --duration 30
+
+The relay tables in that database are truncated first, never point it at a production database.
+"""
+import argparse
+import asyncio
+import importlib
+import random
+import time
+import types
+from collections import deque
+
+import discord
+
+import bot as bot_global
+import start
+from bench.fake_discord import FakeDiscord, FakeHTTP
+from bench.fakes import FakeAttachment, FakeMessage, FakeState, FakeUser, Snowflakes, make_guild, not_found
+from bot.util import database as db
+from bot.util.config import Config
+from bot.util.webhook_client import WebhookClient
+from bot.wormhole import Wormhole
+
+
+class CountingConnection:
+
+    def __init__(self, pool: 'CountingPool', connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def execute(self, *args, **kwargs):
+        self._pool.queries += 1
+        return await self._connection.execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        self._pool.queries += 1
+        return await self._connection.executemany(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        self._pool.queries += 1
+        return await self._connection.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        self._pool.queries += 1
+        return await self._connection.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        self._pool.queries += 1
+        return await self._connection.fetchval(*args, **kwargs)
+
+
+class CountingPool:
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.queries = 0
+
+    async def acquire(self, *, timeout=None):
+        return CountingConnection(self, await self._pool.acquire(timeout=timeout))
+
+    async def release(self, connection):
+        await self._pool.release(connection._connection)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class BenchBot:
+    """Just enough of :class:`Wormhole` for the Link cog, with channels that live in memory."""
+
+    get_webhook_pool = Wormhole.get_webhook_pool
+    get_channel_webhook = Wormhole.get_channel_webhook
+    is_own_webhook = Wormhole.is_own_webhook
+    register_webhook = Wormhole.register_webhook
+
+    def __init__(self, pool, webhook_client: WebhookClient, channels, *, pool_size=1):
+        self.pool = pool
+        self.webhook_client = webhook_client
+        self.webhook_ids: set[int] = set()
+        self.webhook_pool_size = pool_size
+        self.draining = False
+        self.channels = {channel.id: channel for channel in channels}
+        self.guilds = {channel.guild.id: channel.guild for channel in channels}
+        self.cached_messages = deque(maxlen=1000)
+        self.user = FakeUser(1, 'Wormhole', bot=True)
+        self.loop = asyncio.get_running_loop()
+        self.link = None
+
+    def get_link_cog(self):
+        return self.link
+
+    def is_ready(self):
+        return True
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_partial_messageable(self, channel_id, *, guild_id=None):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise not_found()
+        return channel
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    raw_pool = await db.Table.create_pool(args.dsn, min_size=args.db_pool, max_size=args.db_pool)
+    rng = random.Random(args.seed)
+    snowflakes = Snowflakes()
+    fake = FakeDiscord(snowflakes, limit=args.rate_limit, window=args.rate_window)
+    base_url = await fake.start()
+    http = FakeHTTP(base_url)
+
+    bot_global.config = Config.from_dict({
+        'webhook_pool_size': args.pool_size,
+        'relay_coalesce': not args.no_coalesce,
+        'attachment_max_posts': 3,
+    })
+    link_module = importlib.import_module('bot.cogs.link')
+
+    guilds = [
+        make_guild(snowflakes, members=args.members, roles=3, channels=1, state=FakeState(http), on_webhook=fake.add_webhook)
+        for _ in range(args.channels)
+    ]
+    channels = [channel for guild in guilds for channel in guild.channels.values()]
+    async with raw_pool.acquire() as con:
+        await start.create_tables(con, raw_pool)
+        await con.execute('TRUNCATE links, channels, original_messages, synced_messages, webhooks, banned CASCADE;')
+        link_id = await con.fetchval('INSERT INTO links (owner_guild) VALUES ($1) RETURNING id;', guilds[0].id)
+        await con.executemany(
+            'INSERT INTO channels (link_id, guild_id, channel_id) VALUES ($1, $2, $3);',
+            [(link_id, channel.guild.id, channel.id) for channel in channels],
+        )
+
+    pool = CountingPool(raw_pool)
+    client = WebhookClient(base_url=base_url, allowed_mentions=discord.AllowedMentions(roles=False, everyone=False, users=True))
+    await client.start()
+    bot = BenchBot(pool, client, channels, pool_size=args.pool_size)
+    cog = link_module.Link(bot)
+    bot.link = cog
+
+    # Webhook creation and routing lookups are a one off cost, keep them out of the numbers
+    for channel in channels:
+        await bot.get_webhook_pool(channel)
+    await cog.preload_routing()
+    cog.routing_ready.set()
+    pool.queries = 0
+    fake.calls.clear()
+
+    total = int(args.rate * args.duration)
+    history: dict[int, list[FakeMessage]] = {channel.id: [] for channel in channels}
+    recent: deque[FakeMessage] = deque(maxlen=200)
+    sent_at: dict[int, float] = {}
+    tasks = []
+    started = time.monotonic()
+    for number in range(total):
+        delay = started + number / args.rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        channel = rng.choice(channels)
+        author = rng.choice(list(channel.guild.members.values()))
+        reply_to = None
+        if history[channel.id] and rng.random() < args.reply_ratio:
+            reply_to = rng.choice(history[channel.id][-50:])
+        attachments = []
+        if rng.random() < args.attachment_ratio:
+            size = rng.randrange(1024, args.attachment_kib * 1024)
+            attachments.append(FakeAttachment(snowflakes(), 'file-{0}.png'.format(number), size))
+        content = 'msg-{0} '.format(number) + 'lorem ipsum ' * rng.randrange(1, 12)
+        message = FakeMessage(snowflakes(), channel, author, content, attachments=attachments, reply_to=reply_to)
+        history[channel.id].append(message)
+        bot.cached_messages.append(message)
+        sent_at[number] = time.monotonic()
+        tasks.append(asyncio.create_task(cog.on_message(message)))
+
+        if recent and rng.random() < args.reaction_ratio:
+            target = rng.choice(recent)
+            payload = types.SimpleNamespace(
+                guild_id=target.guild.id, channel_id=target.channel.id, message_id=target.id, user_id=author.id, emoji='👍',
+            )
+            tasks.append(asyncio.create_task(cog.on_raw_reaction_add(payload)))
+        if recent and rng.random() < args.edit_ratio:
+            target = rng.choice(recent)
+            payload = types.SimpleNamespace(
+                guild_id=target.guild.id, channel_id=target.channel.id, message_id=target.id, data={'content': target.content + ' (edited)'},
+            )
+            tasks.append(asyncio.create_task(cog.on_raw_message_edit(payload)))
+        if recent and rng.random() < args.delete_ratio:
+            target = recent.popleft()
+            payload = types.SimpleNamespace(guild_id=target.guild.id, channel_id=target.channel.id, message_id=target.id)
+            tasks.append(asyncio.create_task(cog.on_raw_message_delete(payload)))
+        recent.append(message)
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    deadline = time.monotonic() + args.drain_timeout
+    while any(queue.active or queue.pending for queue in cog.relay_queues.values()) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+
+    latencies = [arrived - sent_at[marker] for (marker, _), arrived in fake.arrivals.items() if marker in sent_at]
+    expected = total * (len(channels) - 1)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    print('Messages sent:        {0} over {1:.1f}s into a {2} channel link'.format(total, elapsed, len(channels)))
+    print('Mirrors delivered:    {0} of {1}'.format(len(latencies), expected))
+    print('Time to mirror:       p50 {0:.1f} ms, p99 {1:.1f} ms, max {2:.1f} ms'.format(
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, max(latencies, default=float('nan')) * 1000,
+    ))
+    print('DB queries/message:   {0:.2f}'.format(pool.queries / max(total, 1)))
+    print('API calls/message:    {0:.2f} ({1})'.format(
+        fake.total_calls / max(total, 1), ', '.join('{0}={1}'.format(kind, count) for kind, count in sorted(fake.calls.items())),
+    ))
+    print('Rate limited (429s):  {0}'.format(fake.rate_limited))
+    if errors:
+        print('Handler errors:       {0} (first: {1!r})'.format(len(errors), errors[0]))
+
+    await client.close()
+    await http.close()
+    await raw_pool.close()
+    await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default='postgresql://localhost/wormhole_bench')
+    parser.add_argument('--channels', type=int, default=5, help='channels in the link')
+    parser.add_argument('--rate', type=float, default=10, help='messages per second across the link')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of traffic')
+    parser.add_argument('--members', type=int, default=20, help='members per guild')
+    parser.add_argument('--reply-ratio', type=float, default=0.1)
+    parser.add_argument('--attachment-ratio', type=float, default=0.05)
+    parser.add_argument('--attachment-kib', type=int, default=512, help='largest attachment size')
+    parser.add_argument('--reaction-ratio', type=float, default=0.05)
+    parser.add_argument('--edit-ratio', type=float, default=0.02)
+    parser.add_argument('--delete-ratio', type=float, default=0.01)
+    parser.add_argument('--pool-size', type=int, default=1, help='webhooks per destination channel')
+    parser.add_argument('--no-coalesce', action='store_true')
+    parser.add_argument('--rate-limit', type=int, default=5, help='requests per webhook per window')
+    parser.add_argument('--rate-window', type=float, default=2.0)
+    parser.add_argument('--db-pool', type=int, default=10)
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Replays a gateway trace recorded by :mod:`bot.util.trace` through the real bot.
+
+A full :class:`Wormhole` is built with its cogs, but its REST and webhook traffic goes to
+:mod:`bench.fake_discord` and the routing in the trace header is seeded into a local PostgreSQL.
+Events are then handed to discord.py's own parsers, so everything from payload parsing to the
+webhook posts runs as it did in production.
+
+    python -m bench.replay trace.jsonl.gz --speed 1      # as recorded
+    python -m bench.replay trace.jsonl.gz --speed 10     # ten times faster
+    python -m bench.replay trace.jsonl.gz --speed 0 --profile replay.prof   # as fast as possible
+
+The relay tables in that database are truncated first, never point it at a production database.
+"""
+import argparse
+import asyncio
+import cProfile
+import time
+from collections import Counter
+
+import discord
+
+import bot as bot_global
+import start
+from bench.fake_discord import FakeDiscord
+from bench.fakes import Snowflakes
+from bot.cogs.link import Channels, Links, Webhooks
+from bot.util import database as db
+from bot.util.config import Config
+from bot.util.trace import read_trace
+from bot.wormhole import Wormhole
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def seed(pool, header: dict):
+    async with pool.acquire() as con:
+        await start.create_tables(con, pool)
+        await con.execute('TRUNCATE links, channels, original_messages, synced_messages, webhooks, banned CASCADE;')
+        # COPY, a long trace can carry thousands of channels
+        await Links.insert_many(header['links'], columns=('id', 'owner_guild', 'digest'), connection=con)
+        await Channels.insert_many(header['channels'], columns=('link_id', 'guild_id', 'channel_id', 'invite'), connection=con)
+        # Echoes of the bot's own posts are in the trace too and have to be recognised as such
+        await Webhooks.insert_many(header['webhooks'], columns=('channel_id', 'webhook_id'), connection=con)
+
+
+def busy(bot) -> bool:
+    for task in asyncio.all_tasks():
+        if task.get_name().startswith('discord.py: ') and not task.done():
+            return True
+    link = bot.get_link_cog()
+    return link is not None and any(queue.active or queue.pending for queue in link.relay_queues.values())
+
+
+async def run(args):
+    header, events = read_trace(args.trace)
+    fake = FakeDiscord(Snowflakes(), limit=args.rate_limit, window=args.rate_window)
+    fake.user = header['user']
+    base_url = await fake.start()
+    discord.http.Route.BASE = base_url
+
+    config = dict(header.get('config', {}))
+    if args.pool_size is not None:
+        config['webhook_pool_size'] = args.pool_size
+    config['webhook_client'] = {'base_url': base_url}
+    bot_global.config = Config.from_dict(config)
+
+    pool = await db.Table.create_pool(args.dsn, min_size=args.db_pool, max_size=args.db_pool)
+    await seed(pool, header)
+
+    bot = Wormhole(pool)
+    # Only the relay listeners are replayed, commands would change the seeded routing
+    bot.process_commands = lambda message: asyncio.sleep(0)
+    await bot.login('replay')
+    state = bot._connection
+    for guild in header['guilds']:
+        state._add_guild_from_data(guild)
+
+    counts = Counter()
+    lag = []
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    started = time.monotonic()
+    for event in events:
+        if args.speed:
+            delay = started + event['at'] / args.speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag.append(-delay)
+        else:
+            await asyncio.sleep(0)
+        parser = state.parsers.get(event['t'])
+        if parser is None:
+            continue
+        counts[event['t']] += 1
+        try:
+            parser(event['d'])
+        except Exception as error:
+            counts['parse_error'] += 1
+            if counts['parse_error'] == 1:
+                print('Failed parsing {0}: {1!r}'.format(event['t'], error))
+    dispatched = time.monotonic() - started
+
+    deadline = time.monotonic() + args.drain_timeout
+    while busy(bot) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    total = sum(count for name, count in counts.items() if name != 'parse_error')
+    print('Events replayed:      {0} in {1:.1f}s ({2:.0f}/s), drained after {3:.1f}s'.format(
+        total, dispatched, total / max(dispatched, 1e-9), elapsed,
+    ))
+    print('By type:              {0}'.format(', '.join('{0}={1}'.format(name, count) for name, count in counts.most_common())))
+    if args.speed:
+        print('Dispatch lag:         p99 {0:.1f} ms, max {1:.1f} ms'.format(percentile(lag, 0.99) * 1000, max(lag, default=0) * 1000))
+    print('API calls:            {0} ({1})'.format(
+        fake.total_calls, ', '.join('{0}={1}'.format(kind, count) for kind, count in sorted(fake.calls.items())),
+    ))
+    print('Rate limited (429s):  {0}'.format(fake.rate_limited))
+    if profiler is not None:
+        print('Profile written to {0}'.format(args.profile))
+
+    await bot.close()
+    await pool.close()
+    await fake.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', help='a .jsonl.gz trace')
+    parser.add_argument('--dsn', default='postgresql://localhost/wormhole_bench')
+    parser.add_argument('--speed', type=float, default=1, help='1 is as recorded, 0 is as fast as possible')
+    parser.add_argument('--pool-size', type=int, help='webhooks per destination, defaults to the recorded config')
+    parser.add_argument('--rate-limit', type=int, default=5, help='requests per webhook per window')
+    parser.add_argument('--rate-window', type=float, default=2.0)
+    parser.add_argument('--db-pool', type=int, default=10)
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    parser.add_argument('--profile', metavar='FILE', help='write cProfile stats of the replay')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,35 @@
 import asyncio
+import json
 import logging
+import os
+import pathlib
+import typing
+from collections import defaultdict
+from datetime import timedelta
 
 import discord
 from discord import utils
-from discord.ext import commands
+from discord.ext import commands, tasks
 
+import bot as bot_global
 from bot.core.embed import Embed
+from bot.util.attachments import AttachmentFiles
 from bot.util.clean_content import clean_content
+from bot.util.digest import DigestEntry, build_digests
+from bot.util.health import DestinationHealth
+from bot.util.outbox import Outbox
+from bot.util.relay import RelayItem, RelayQueue
+from bot.util.spill import SpillLog
+from bot.util.webhook_client import WebhookResponse
 from bot.util.webhooker import Webhooker, BasicMessage
 from bot.wormhole import Wormhole
-from bot.util import database as db, cache
+from bot.util import database as db, cache, metrics, spill
 
 
 class Links(db.Table, table_name="links"):
     id = db.Column(db.Integer(), unique=True)
     owner_guild = db.Column(db.Integer(big=True))
+    digest = db.Column(db.Boolean(), default=False)
 
     @classmethod
     def create_table(cls, overwrite=False):
@@ -23,6 +38,7 @@ class Links(db.Table, table_name="links"):
             id bigint primary key default pseudo_encrypt(nextval('link_id_seq')),
             owner_guild bigint
         );
+        ALTER TABLE links ADD COLUMN IF NOT EXISTS digest BOOLEAN DEFAULT FALSE;
         """
 
 
@@ -43,6 +59,14 @@ class Channels(db.Table, table_name="channels"):
     guild_id = db.Column(db.Integer(big=True))
     channel_id = db.Column(db.Integer(big=True), unique=True)
     invite = db.Column(db.Boolean(), default="false")
+    last_message_id = db.Column(db.Integer(big=True))
+
+    @classmethod
+    def create_table(cls, overwrite=False):
+        statement = super().create_table(overwrite)
+        # The newest message seen in the channel, catch-up after downtime starts from it
+        sql = 'ALTER TABLE channels ADD COLUMN IF NOT EXISTS last_message_id BIGINT;'
+        return statement + '\n' + sql
 
 
 class OriginalMessages(db.Table, table_name="original_messages"):
@@ -56,7 +80,25 @@ class SyncedMessages(db.Table, table_name="synced_messages"):
     original_id = db.Column(db.ForeignKey(table="original_messages", column="message_id", sql_type=db.Integer(big=True)))
     guild_id = db.Column(db.Integer(big=True))
     channel_id = db.Column(db.Integer(big=True))
-    message_id = db.Column(db.Integer(big=True), unique=True)
+    message_id = db.Column(db.Integer(big=True), index=True)
+    webhook_id = db.Column(db.Integer(big=True))
+    digest = db.Column(db.Boolean(), default=False)
+
+    @classmethod
+    def create_table(cls, overwrite=False):
+        statement = super().create_table(overwrite)
+        # Coalesced mirrors and digests are shared by several originals, so only the pair is unique
+        sql = 'ALTER TABLE synced_messages ADD COLUMN IF NOT EXISTS webhook_id BIGINT;' \
+              'ALTER TABLE synced_messages ADD COLUMN IF NOT EXISTS digest BOOLEAN DEFAULT FALSE;' \
+              'ALTER TABLE synced_messages DROP CONSTRAINT IF EXISTS synced_messages_message_id_key;' \
+              'ALTER TABLE synced_messages DROP CONSTRAINT IF EXISTS unique_synced;' \
+              'ALTER TABLE synced_messages ADD CONSTRAINT unique_synced UNIQUE(original_id, message_id);'
+        return statement + '\n' + sql
+
+
+class Webhooks(db.Table, table_name="webhooks"):
+    channel_id = db.Column(db.Integer(big=True))
+    webhook_id = db.Column(db.Integer(big=True), unique=True)
 
 
 class Link(commands.Cog):
@@ -66,6 +108,269 @@ class Link(commands.Cog):
         self.invites = cache.ExpiringDict(seconds=60 * 15)
         self.locked_clears = []
         self.locked_emoji_clears = []
+        self.relay_queues: dict[int, RelayQueue] = {}
+        self.coalesce = bot_global.config.get('relay_coalesce', True)
+        self.attachment_posts = bot_global.config.get('attachment_max_posts', 3)
+        self.digests: dict[int, list[DigestEntry]] = defaultdict(list)
+        self.digest_posts = bot_global.config.get('digest_max_posts', 3)
+        self.flush_digests.change_interval(seconds=bot_global.config.get('digest_interval', 10))
+        # Set once routing is cached and the guilds have arrived. Before that messages wait instead of
+        # failing to find their destinations.
+        self.routing_ready = asyncio.Event()
+        self.chunking: typing.Optional[asyncio.Task] = None
+        # Newest message per linked channel since the last flush to the channels table
+        self.last_seen: dict[int, int] = {}
+        # Where each channel was saved up to when the cog loaded, before live messages move it
+        self.catch_up_from: dict[int, int] = {}
+        self.catch_up_enabled = bot_global.config.get('catch_up', True)
+        self.catch_up_concurrency = bot_global.config.get('catch_up_concurrency', 4)
+        self.catch_up_limit = bot_global.config.get('catch_up_limit', 500)
+        self.catching_up: typing.Optional[asyncio.Task] = None
+        self.outbox = Outbox(bot, **bot_global.config.get('outbox', {}))
+        health = dict(bot_global.config.get('health', {}))
+        self.notify_owners = health.pop('notify', True)
+        self.health = DestinationHealth(on_open=self.destination_opened, **health)
+        spill_settings = dict(bot_global.config.get('spill', {}))
+        # Relay writes slower than this go to the spill log instead
+        self.db_timeout = spill_settings.pop('timeout', 2)
+        self.routing_snapshot = pathlib.Path(spill_settings.pop('routing_snapshot', 'routing.json'))
+        self.spill = SpillLog(**spill_settings)
+        # Orphaned channels are deleted this many at a time
+        self.reconcile_batch = bot_global.config.get('reconcile_batch', 500)
+        self.reconcile_channels.change_interval(seconds=bot_global.config.get('reconcile_interval', 60 * 60))
+        metrics.gauge(
+            'wormhole_relay_pending', 'Posts waiting behind a busy destination.',
+            callback=lambda: sum(len(queue.pending) for queue in self.relay_queues.values()),
+        )
+
+    async def cog_load(self):
+        self.flush_digests.start()
+        self.flush_last_seen.start()
+        self.outbox.start()
+        self.probe_destinations.start()
+        self.spill.load()
+        self.replay_spill.start()
+        self.reconcile_channels.start()
+        await self.preload_routing()
+        if self.bot.is_ready() or not self.bot.lazy_chunking:
+            self.routing_ready.set()
+
+    async def cog_unload(self):
+        self.flush_digests.cancel()
+        self.flush_last_seen.cancel()
+        self.probe_destinations.cancel()
+        self.replay_spill.cancel()
+        self.reconcile_channels.cancel()
+        await self.spill.flush()
+        await self.outbox.close()
+        if self.catching_up is not None:
+            self.catching_up.cancel()
+        if self.chunking is not None:
+            self.chunking.cancel()
+
+    async def drain(self, *, timeout=30):
+        """Posts everything still queued and any pending digests, so a shutdown doesn't drop relays."""
+        queued = sum(queue.active + len(queue.pending) for queue in self.relay_queues.values())
+        self.flush_digests.cancel()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(self.drain_digests(), *(queue.drain() for queue in self.relay_queues.values())), timeout,
+            )
+        except asyncio.TimeoutError:
+            logging.warning('Gave up draining relays after {0} seconds.'.format(timeout))
+        else:
+            logging.info('Drained {0} queued relays.'.format(queued))
+        self.flush_last_seen.cancel()
+        await self.flush_last_seen()
+
+    async def preload_routing(self):
+        """Fills the routing caches for every linked channel, so the first messages after a restart don't each
+        wait on the database.
+
+        Falls back to the snapshot of the last load when the database is unavailable. That only helps when the
+        cog is reloaded during an outage, start.py still needs PostgreSQL to create the pool before the bot runs.
+        """
+        try:
+            links, channels = await asyncio.wait_for(self.fetch_routing(), self.db_timeout * 15)
+        except db.UNAVAILABLE as e:
+            logging.warning('Database unavailable, loading routing from {0}: {1!r}'.format(self.routing_snapshot, e))
+            links, channels = await asyncio.to_thread(self.read_routing_snapshot)
+        else:
+            await asyncio.to_thread(self.write_routing_snapshot, links, channels)
+        self.catch_up_from = {row['channel_id']: row['last_message_id'] for row in channels if row['last_message_id'] is not None}
+        link_channels = defaultdict(list)
+        for row in channels:
+            link_channels[row['link_id']].append(row)
+            self.get_channel_data.set(row, self, row['channel_id'])
+        for row in links:
+            self.get_link_data.set(row, self, row['id'])
+            self.get_link_channels.set(link_channels[row['id']], self, row['id'])
+        logging.info('Loaded routing for {0} links and {1} channels.'.format(len(links), len(channels)))
+
+    async def fetch_routing(self):
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            links = await con.fetch('SELECT * FROM links;')
+            channels = await con.fetch('SELECT * FROM channels;')
+        return links, channels
+
+    def write_routing_snapshot(self, links, channels):
+        temporary = self.routing_snapshot.with_suffix('.tmp')
+        with open(temporary, 'w') as snapshot:
+            json.dump({'links': [dict(row) for row in links], 'channels': [dict(row) for row in channels]}, snapshot)
+        os.replace(temporary, self.routing_snapshot)
+
+    def read_routing_snapshot(self) -> tuple[list[dict], list[dict]]:
+        try:
+            with open(self.routing_snapshot) as snapshot:
+                data = json.load(snapshot)
+        except (OSError, ValueError) as e:
+            logging.warning('No usable routing snapshot, relaying waits for the database: {0!r}'.format(e))
+            return [], []
+        return data['links'], data['channels']
+
+    def database_unavailable(self, error: Exception):
+        if not self.spill.active:
+            logging.warning('Database unavailable, spilling relay writes to {0}: {1!r}'.format(self.spill.path, error))
+            self.spill.active = True
+
+    @tasks.loop(seconds=15)
+    async def replay_spill(self):
+        if not self.spill.active:
+            return
+        try:
+            replayed = await asyncio.wait_for(self.spill.replay(self.bot.pool), self.db_timeout * 15)
+        except db.UNAVAILABLE:
+            return
+        except Exception:
+            # Anything else would stop the loop for good and leave relaying on the spill log
+            logging.exception('Failed replaying the spill log')
+            return
+        logging.info('Database is back, replayed {0} spilled rows.'.format(replayed))
+
+    async def store_original(self, message: discord.Message) -> bool:
+        """Records a new original. False when it was recorded before, so it has been relayed already."""
+        row = {'guild_id': message.guild.id, 'channel_id': message.channel.id, 'message_id': message.id, 'author_id': message.author.id}
+        if not self.spill.active:
+            try:
+                return await asyncio.wait_for(self.insert_original(row), self.db_timeout)
+            except db.UNAVAILABLE as e:
+                self.database_unavailable(e)
+        if row['message_id'] in self.spill.originals:
+            return False
+        self.spill.append(spill.ORIGINALS, row)
+        return True
+
+    async def insert_original(self, row: dict) -> bool:
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            inserted = await con.fetchval(
+                "INSERT INTO original_messages(guild_id, channel_id, message_id, author_id) VALUES ($1, $2, $3, $4) "
+                "ON CONFLICT (message_id) DO NOTHING RETURNING message_id",
+                row['guild_id'],
+                row['channel_id'],
+                row['message_id'],
+                row['author_id'],
+            )
+        return inserted is not None
+
+    async def store_synced(self, rows: list[dict]):
+        if not self.spill.active:
+            try:
+                await asyncio.wait_for(self.insert_synced(rows), self.db_timeout)
+                return
+            except db.UNAVAILABLE as e:
+                self.database_unavailable(e)
+        for row in rows:
+            self.spill.append(spill.SYNCED, row)
+
+    async def insert_synced(self, rows: list[dict]):
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await SyncedMessages.upsert_many(rows, conflict=('original_id', 'message_id'), connection=con)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.routing_ready.set()
+        if self.catch_up_enabled and self.catching_up is None:
+            self.catching_up = self.bot.loop.create_task(self.catch_up())
+        if self.bot.lazy_chunking and self.bot.intents.members and self.chunking is None:
+            self.chunking = self.bot.loop.create_task(self.chunk_linked_guilds())
+
+    @tasks.loop(seconds=30)
+    async def flush_last_seen(self):
+        last_seen, self.last_seen = self.last_seen, {}
+        if not last_seen:
+            return
+        try:
+            async with db.MaybeAcquire(pool=self.bot.pool) as con:
+                await con.executemany(
+                    'UPDATE channels SET last_message_id = GREATEST(last_message_id, $2) WHERE channel_id = $1;',
+                    list(last_seen.items()),
+                )
+        except Exception:
+            logging.exception('Failed saving the last seen messages')
+            for channel_id, message_id in last_seen.items():
+                self.last_seen[channel_id] = max(message_id, self.last_seen.get(channel_id, 0))
+
+    async def catch_up(self):
+        """Relays what was sent in linked channels while the bot was offline.
+
+        Only channels whose newest message is past the one saved when the cog loaded are read. Live
+        messages relayed since then have already moved the saved one, and are skipped as duplicates.
+        The channels that have been behind the longest go first, and at most ``catch_up_concurrency``
+        are read at once.
+        """
+        behind = []
+        for channel_id, after in self.catch_up_from.items():
+            channel = self.bot.get_channel(channel_id)
+            latest = getattr(channel, 'last_message_id', None)
+            if latest is None or latest <= after:
+                continue
+            # Snowflakes start with a timestamp, so the difference is how long the channel went unread
+            behind.append((latest - after, channel, after))
+        self.catch_up_from = {}
+        if not behind:
+            return
+        behind.sort(key=lambda entry: entry[0], reverse=True)
+        semaphore = asyncio.Semaphore(self.catch_up_concurrency)
+        counts = await asyncio.gather(*(self.catch_up_channel(channel, after, semaphore) for _, channel, after in behind))
+        logging.info('Caught up on {0} messages in {1} channels.'.format(sum(counts), len(behind)))
+
+    async def catch_up_channel(self, channel: discord.TextChannel, after: int, semaphore: asyncio.Semaphore) -> int:
+        count = 0
+        async with semaphore:
+            try:
+                history = channel.history(after=discord.Object(id=after), oldest_first=True, limit=self.catch_up_limit)
+                async for message in history:
+                    if self.bot.draining:
+                        break
+                    # Same path as live messages, so it is deduplicated, queued and coalesced the same way
+                    await self.on_message(message)
+                    count += 1
+            except discord.HTTPException as e:
+                logging.warning('Failed catching up on channel {0}: {1}'.format(channel.id, e))
+        return count
+
+    async def chunk_linked_guilds(self):
+        """Chunks the guilds with linked channels, busiest first. Other guilds are never chunked."""
+        since = utils.time_snowflake(utils.utcnow() - timedelta(days=7))
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            rows = await con.fetch(
+                "SELECT channels.guild_id, count(original_messages.message_id) AS activity FROM channels "
+                "LEFT JOIN original_messages ON original_messages.channel_id = channels.channel_id AND original_messages.message_id > $1 "
+                "GROUP BY channels.guild_id ORDER BY activity DESC;",
+                since,
+            )
+        chunked = 0
+        for row in rows:
+            guild = self.bot.get_guild(row['guild_id'])
+            if guild is None or guild.chunked:
+                continue
+            try:
+                await guild.chunk()
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                logging.warning('Failed chunking guild {0}: {1}'.format(guild.id, e))
+                continue
+            chunked += 1
+        logging.info('Chunked {0} linked guilds.'.format(chunked))
 
     @cache.cache(maxsize=512)
     async def get_link_channels(self, link_id) -> list[dict]:
@@ -95,31 +400,102 @@ class Link(commands.Cog):
         self.get_channel_data.invalidate(self, channel.id)
         self.get_link_channels.invalidate(self, row['link_id'])
         self.get_link_data.invalidate(self, row['link_id'])
-        self.bot.get_channel_webhook.invalidate(self, channel)
+        self.bot.get_webhook_pool.invalidate(self.bot, channel)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
+        await self.remove_guild(guild.id)
+
+    async def remove_guild(self, guild_id: int):
+        """Drops everything a guild left behind in one transaction.
+
+        Links it owned move to another guild that is still in them, links only it was in are deleted,
+        and its channels, webhooks and relayed messages go with it.
+        """
         async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            # Remove from database
-            rows = await con.fetch("SELECT * FROM links WHERE owner_guild = $1;", guild.id)
-            for r in rows:
-                channels = await con.fetch("SELECT * FROM channels WHERE link_id = $1;", r['link_id'])
-                found = None
-                for c in channels:
-                    if c['guild_id'] != guild.id:
-                        found = c['guild_id']
-                        break
-                if found:
-                    # Migrate to new owner
-                    await con.execute("UPDATE links SET owner_guild = $1 WHERE owner_guild = $2;", found, guild.id)
-                    await con.execute("DELETE * FROM channels WHERE link_id = $1 AND guild_id = $2;", r['link_id'], guild.id)
-                else:
-                    await con.execute("DELETE * FROM channels WHERE link_id = $1;", r['link_id'])
-                    await con.execute("DELETE * FROM links WHERE id = $1;", r['link_id'])
-                self.get_link_channels.invalidate(self, r['link_id'])
-                self.get_link_data.invalidate(self, r['link_id'])
+            async with con.transaction():
+                await con.execute(
+                    "UPDATE links SET owner_guild = heirs.guild_id "
+                    "FROM (SELECT DISTINCT ON (link_id) link_id, guild_id FROM channels WHERE guild_id <> $1 ORDER BY link_id, channel_id) heirs "
+                    "WHERE links.owner_guild = $1 AND links.id = heirs.link_id;",
+                    guild_id,
+                )
+                channels = await con.fetch("DELETE FROM channels WHERE guild_id = $1 RETURNING link_id, channel_id;", guild_id)
+                links = await con.fetch("DELETE FROM links WHERE owner_guild = $1 RETURNING id;", guild_id)
+                channel_ids = [row['channel_id'] for row in channels]
+                webhooks = await Webhooks.delete_where_in('channel_id', channel_ids, returning=True, connection=con)
+                await con.execute(
+                    "DELETE FROM synced_messages WHERE guild_id = $1 "
+                    "OR original_id IN (SELECT message_id FROM original_messages WHERE guild_id = $1);",
+                    guild_id,
+                )
+                await con.execute("DELETE FROM original_messages WHERE guild_id = $1;", guild_id)
+        self.bot.webhook_ids.difference_update(webhook.webhook_id for webhook in webhooks)
+        link_ids = {row['link_id'] for row in channels} | {row['id'] for row in links}
+        self.forget_routing(link_ids, channel_ids)
+        logging.info('Removed guild {0} from {1} links and {2} channels.'.format(guild_id, len(link_ids), len(channel_ids)))
+
+    def forget_routing(self, link_ids: typing.Iterable[int], channel_ids: typing.Iterable[int]):
+        """Invalidates the routing cached for removed links and channels, and the state kept per channel."""
+        for link_id in link_ids:
+            self.get_link_channels.invalidate(self, link_id)
+            self.get_link_data.invalidate(self, link_id)
+        for channel_id in channel_ids:
+            self.get_channel_data.invalidate(self, channel_id)
+            self.last_seen.pop(channel_id, None)
+            self.health.circuits.pop(channel_id, None)
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                self.bot.get_webhook_pool.invalidate(self.bot, channel)
+
+    @tasks.loop(hours=1)
+    async def reconcile_channels(self):
+        """Prunes channels the bot can no longer see, guild by guild, so dead rows don't pile up in routing."""
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            rows = await con.fetch("SELECT guild_id, array_agg(channel_id) AS channel_ids FROM channels GROUP BY guild_id;")
+        removed_guilds = 0
+        orphans = []
+        for row in rows:
+            guild = self.bot.get_guild(row['guild_id'])
+            if guild is None:
+                await self.remove_guild(row['guild_id'])
+                removed_guilds += 1
+                continue
+            if guild.unavailable:
+                # An outage, its channels aren't gone
+                continue
+            for channel_id in row['channel_ids']:
+                if guild.get_channel_or_thread(channel_id) is None and await self.channel_gone(channel_id):
+                    orphans.append(channel_id)
+        for start in range(0, len(orphans), self.reconcile_batch):
+            await self.remove_channels(orphans[start:start + self.reconcile_batch])
+        if removed_guilds or orphans:
+            logging.info('Reconciled links, removed {0} guilds and {1} channels.'.format(removed_guilds, len(orphans)))
+
+    @reconcile_channels.before_loop
+    async def before_reconcile_channels(self):
+        await self.bot.wait_until_ready()
+
+    async def channel_gone(self, channel_id: int) -> bool:
+        # Archived threads aren't cached, so a miss is only trusted once Discord confirms it
+        try:
+            await self.bot.fetch_channel(channel_id)
+        except (discord.NotFound, discord.Forbidden):
+            return True
+        except discord.HTTPException:
+            return False
+        return False
+
+    async def remove_channels(self, channel_ids: list[int]):
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            async with con.transaction():
+                channels = await Channels.delete_where_in('channel_id', channel_ids, returning=True, connection=con)
+                webhooks = await Webhooks.delete_where_in('channel_id', channel_ids, returning=True, connection=con)
+        self.bot.webhook_ids.difference_update(webhook.webhook_id for webhook in webhooks)
+        self.forget_routing({channel.link_id for channel in channels}, channel_ids)
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_typing(self, typing_channel: discord.TextChannel, member: discord.Member, when):
         if typing_channel.guild is None:
             return
@@ -134,11 +510,11 @@ class Link(commands.Cog):
             return
         for channel_row in link_data:
             channel_id = channel_row['channel_id']
-            if channel_id == typing_channel.id:
+            if channel_id == typing_channel.id or not self.health.available(channel_id):
                 continue
             channel = self.bot.get_channel(channel_id)
             if channel is None:
-                logging.warning("Channel ID " + channel_id + " cannot be found.")
+                self.channel_missing(channel_id, channel_row['guild_id'])
                 continue
             await channel.typing()
 
@@ -159,11 +535,102 @@ class Link(commands.Cog):
                 return True
         except:
             return False
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            row = await con.fetchrow("SELECT * FROM banned WHERE guild_id = $1 AND user_id = $2;", guild_id, user_id)
+        try:
+            row = await asyncio.wait_for(self.fetch_ban(guild_id, user_id), self.db_timeout)
+        except db.UNAVAILABLE:
+            # Not cached, so it is looked up again once the database is back
+            return None
         return bool(row)
 
+    async def fetch_ban(self, guild_id, user_id):
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            return await con.fetchrow("SELECT * FROM banned WHERE guild_id = $1 AND user_id = $2;", guild_id, user_id)
+
+    async def get_relayed(self, message_id) -> tuple[list, list]:
+        """Finds the originals and mirrors tied to a message, from whichever side of the link it is on.
+
+        A coalesced mirror or a digest stands in for several originals, so every mirror row carries
+        ``originals`` and ``original_channels`` arrays describing all of them. A digest is never
+        treated as the source of its originals, reacting to or deleting one only affects itself.
+        While the database is unavailable only messages relayed since then are found.
+        """
+        if not self.spill.active:
+            try:
+                return await asyncio.wait_for(self.fetch_relayed(message_id), self.db_timeout)
+            except db.UNAVAILABLE as e:
+                self.database_unavailable(e)
+        return self.spill.relayed(message_id)
+
+    async def fetch_relayed(self, message_id) -> tuple[list, list]:
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            originals = await con.fetch(
+                "SELECT * FROM original_messages WHERE message_id = $1 "
+                "OR message_id IN (SELECT original_id FROM synced_messages WHERE message_id = $1 AND digest IS NOT TRUE) ORDER BY message_id;",
+                message_id,
+            )
+            if not originals:
+                return [], []
+            mirrors = await con.fetch(
+                """SELECT s.message_id, s.guild_id, s.channel_id, s.webhook_id, bool_or(s.digest) AS digest,
+                    array_agg(s.original_id ORDER BY s.original_id) AS originals,
+                    array_agg(o.channel_id ORDER BY s.original_id) AS original_channels
+                FROM synced_messages s JOIN original_messages o ON o.message_id = s.original_id
+                WHERE s.message_id IN (SELECT message_id FROM synced_messages WHERE original_id = ANY($1::bigint[]))
+                GROUP BY s.message_id, s.guild_id, s.channel_id, s.webhook_id;""",
+                [row['message_id'] for row in originals],
+            )
+        return originals, mirrors
+
+    async def get_relayed_messages(self, channel_id, originals, mirrors) -> list[discord.PartialMessage]:
+        messages = []
+        for row in [*originals, *mirrors]:
+            if row['channel_id'] == channel_id or not self.health.available(row['channel_id']):
+                continue
+            message = utils.get(self.bot.cached_messages, id=row['message_id'])
+            if not message:
+                channel = self.bot.get_channel(row['channel_id'])
+                if not channel:
+                    try:
+                        channel = await self.bot.fetch_channel(row['channel_id'])
+                    except discord.HTTPException as e:
+                        self.health.failure(row['channel_id'], e)
+                        continue
+                message = channel.get_partial_message(row['message_id'])
+            messages.append(message)
+        return messages
+
+    async def get_original_contents(self, originals, *, edited=None, edited_content=None) -> list[tuple[discord.Message, str]]:
+        """Fetches ``(channel_id, message_id)`` originals along with their cleaned content."""
+        contents = []
+        for channel_id, original_id in originals:
+            if edited is not None and original_id == edited.id:
+                contents.append((edited, clean_content(edited, edited_content)))
+                continue
+            message = utils.get(self.bot.cached_messages, id=original_id)
+            if not message:
+                channel = self.bot.get_channel(channel_id) or self.bot.get_partial_messageable(channel_id)
+                try:
+                    message = await channel.fetch_message(original_id)
+                except discord.HTTPException:
+                    continue
+            contents.append((message, clean_content(message)))
+        return contents
+
+    async def rebuild_mirror(self, mirror, originals, *, edited=None, edited_content=None):
+        """Edits a coalesced mirror or digest so it only shows ``originals``."""
+        contents = await self.get_original_contents(originals, edited=edited, edited_content=edited_content)
+        if mirror['digest']:
+            entries = [DigestEntry.from_message(message, content) for message, content in contents]
+            # An edit can't add posts, whatever no longer fits is cut. The mirror still maps every original.
+            digests, _ = build_digests(entries, max_posts=1)
+            kwargs = {'embeds': [embed for embed, _ in digests]}
+        else:
+            kwargs = {'content': '\n'.join(content for _, content in contents)}
+        channel = self.bot.get_channel(mirror['channel_id'])
+        await Webhooker(self.bot, channel).edit(mirror['message_id'], webhook_id=mirror['webhook_id'], **kwargs)
+
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         if payload.guild_id is None:
             return
@@ -172,39 +639,15 @@ class Link(commands.Cog):
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            original = True
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                original = False
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", payload.message_id)
-            if not message_data:
-                # Doesn't exist anywhere
-                return
-            all_messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", message_data["message_id"])
-            if not original:
-                all_messages.append(message_data)
-        for m in all_messages:
-            channel_id = m['channel_id']
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                channel = await self.bot.fetch_channel(channel_id)
-            if not channel:
-                logging.warning("Couldn't find channel " + channel_id)
-                continue
-            if channel_id != payload.channel_id:
-                message = utils.get(self.bot.cached_messages, id=m['message_id'])
-                if not message:
-                    message = discord.PartialMessage(
-                        channel=channel, id=m['message_id']
-                    )
-                    await message.fetch()
-                try:
-                    await message.add_reaction(payload.emoji)
-                except:
-                    pass
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        for message in await self.get_relayed_messages(payload.channel_id, originals, mirrors):
+            try:
+                await message.add_reaction(payload.emoji)
+            except:
+                pass
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
         if payload.guild_id is None:
             return
@@ -213,42 +656,15 @@ class Link(commands.Cog):
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            original = True
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                original = False
-                message_data = await con.fetchrow(
-                    "SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);",
-                    payload.message_id
-                    )
-            if not message_data:
-                # Doesn't exist anywhere
-                return
-            all_messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", message_data["message_id"])
-            if not original:
-                all_messages.append(message_data)
-        for m in all_messages:
-            channel_id = m['channel_id']
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                channel = await self.bot.fetch_channel(channel_id)
-            if not channel:
-                logging.warning("Couldn't find channel " + channel_id)
-                continue
-            if channel_id != payload.channel_id:
-                message = utils.get(self.bot.cached_messages, id=m['message_id'])
-                if not message:
-                    message = discord.PartialMessage(
-                        channel=channel, id=m['message_id']
-                    )
-                    await message.fetch()
-                try:
-                    await message.remove_reaction(payload.emoji, self.bot.user)
-                except:
-                    pass
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        for message in await self.get_relayed_messages(payload.channel_id, originals, mirrors):
+            try:
+                await message.remove_reaction(payload.emoji, self.bot.user)
+            except:
+                pass
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
         if payload.message_id in self.locked_clears:
             return
@@ -257,44 +673,25 @@ class Link(commands.Cog):
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            original = True
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                original = False
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", payload.message_id)
-            if not message_data:
-                # Doesn't exist anywhere
-                return
-            all_messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", message_data["message_id"])
-            if not original:
-                all_messages.append(message_data)
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        if not originals:
+            # Doesn't exist anywhere
+            return
         if payload.message_id in self.locked_clears:
             return
         self.locked_clears.append(payload.message_id)
-        for m in all_messages:
-            channel_id = m['channel_id']
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                channel = await self.bot.fetch_channel(channel_id)
-            if not channel:
-                logging.warning("Couldn't find channel " + channel_id)
-                continue
-            if channel_id != payload.channel_id:
-                message = utils.get(self.bot.cached_messages, id=m['message_id'])
-                if not message:
-                    message = discord.PartialMessage(
-                        channel=channel, id=m['message_id']
-                    )
-                    await message.fetch()
+        try:
+            for message in await self.get_relayed_messages(payload.channel_id, originals, mirrors):
                 try:
                     await message.clear_reactions()
                 except:
                     pass
-        await asyncio.sleep(3)
-        self.locked_clears.remove(payload.message_id)
+            await asyncio.sleep(3)
+        finally:
+            self.locked_clears.remove(payload.message_id)
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
         if payload.message_id in self.locked_emoji_clears:
             return
@@ -303,44 +700,25 @@ class Link(commands.Cog):
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            original = True
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                original = False
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", payload.message_id)
-            if not message_data:
-                # Doesn't exist anywhere
-                return
-            all_messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", message_data["message_id"])
-            if not original:
-                all_messages.append(message_data)
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        if not originals:
+            # Doesn't exist anywhere
+            return
         if payload.message_id in self.locked_emoji_clears:
             return
         self.locked_emoji_clears.append(payload.message_id)
-        for m in all_messages:
-            channel_id = m['channel_id']
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                channel = await self.bot.fetch_channel(channel_id)
-            if not channel:
-                logging.warning("Couldn't find channel " + channel_id)
-                continue
-            if channel_id != payload.channel_id:
-                message = utils.get(self.bot.cached_messages, id=m['message_id'])
-                if not message:
-                    message = discord.PartialMessage(
-                        channel=channel, id=m['message_id']
-                    )
-                    await message.fetch()
+        try:
+            for message in await self.get_relayed_messages(payload.channel_id, originals, mirrors):
                 try:
                     await message.clear_reaction(payload.emoji)
                 except:
                     pass
-        await asyncio.sleep(3)
-        self.locked_emoji_clears.remove(payload.message_id)
+            await asyncio.sleep(3)
+        finally:
+            self.locked_emoji_clears.remove(payload.message_id)
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
         if payload.guild_id is None:
             return
@@ -350,113 +728,130 @@ class Link(commands.Cog):
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        if not originals or originals[0]['message_id'] != payload.message_id:
+            # Seems to be a proxied message or just doesn't exist
+            return
         message = utils.get(self.bot.cached_messages, id=payload.message_id)
         if not message:
             message = discord.PartialMessage(channel=self.bot.get_partial_messageable(id=payload.channel_id, guild_id=payload.guild_id), id=payload.message_id)
-            await message.fetch()
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                # Seems to be a proxied message or just doesn't exist
-                return
-            messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", payload.message_id)
-        for m in messages:
+            message = await message.fetch()
+        edited = set()
+        for m in sorted(mirrors, key=lambda row: row['message_id']):
             channel_id = m['channel_id']
+            if channel_id in edited:
+                # Later mirrors in a channel only carry attachments
+                continue
+            edited.add(channel_id)
+            if not self.health.available(channel_id):
+                continue
             channel = self.bot.get_channel(channel_id)
             if not channel:
-                channel = await self.bot.fetch_channel(channel_id)
-            if not channel:
-                logging.warning("Couldn't find channel " + channel_id)
-                continue
-            webhooker = Webhooker(self.bot, channel)
+                try:
+                    channel = await self.bot.fetch_channel(channel_id)
+                except discord.HTTPException as e:
+                    logging.warning("Couldn't find channel {0}".format(channel_id))
+                    self.health.failure(channel_id, e)
+                    continue
             try:
-                await webhooker.edit(m['message_id'], content=clean_content(message, payload.data['content']))
+                if len(m['originals']) > 1 or m['digest']:
+                    await self.rebuild_mirror(
+                        m, zip(m['original_channels'], m['originals']), edited=message, edited_content=payload.data['content'],
+                    )
+                else:
+                    webhooker = Webhooker(self.bot, channel)
+                    await webhooker.edit(m['message_id'], webhook_id=m['webhook_id'], content=clean_content(message, payload.data['content']))
             except Exception as e:
                 logging.warning(e)
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
         if payload.guild_id is None:
             return
         channel_data = await self.get_channel_data(payload.channel_id)
         if channel_data is None:
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            original = True
-            message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
-            if not message_data:
-                original = False
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", payload.message_id)
-            if not message_data:
-                # Doesn't exist anywhere
-                return
-            all_messages = await con.fetch("SELECT * FROM synced_messages WHERE original_id = $1;", message_data["message_id"])
-            if not original:
-                all_messages.append(message_data)
-            await con.execute(f"""
-                DELETE FROM synced_messages WHERE original_id = {message_data['message_id']};
-                DELETE FROM original_messages WHERE message_id = {message_data['message_id']};""")
-        for message in all_messages:
+        originals, mirrors = await self.get_relayed(payload.message_id)
+        if not originals:
+            # Doesn't exist anywhere
+            return
+        deleted = [row['message_id'] for row in originals]
+        if not self.spill.active:
+            try:
+                await asyncio.wait_for(self.delete_originals(deleted), self.db_timeout)
+            except db.UNAVAILABLE as e:
+                self.database_unavailable(e)
+        self.spill.forget(deleted)
+        for message in [*originals, *mirrors]:
             guild_id = message["guild_id"]
             channel_id = message["channel_id"]
             message_id = message["message_id"]
-            if channel_id == payload.channel_id:
+            if channel_id == payload.channel_id or not self.health.available(channel_id):
                 continue
+            # A coalesced mirror or digest only goes away once nothing it shows is left
+            remaining = [
+                (c, o) for c, o in zip(message.get('original_channels', ()), message.get('originals', ())) if o not in deleted
+            ]
             try:
-                await discord.PartialMessage(channel=self.bot.get_partial_messageable(channel_id, guild_id=guild_id), id=message_id).delete()
+                if remaining:
+                    await self.rebuild_mirror(message, remaining)
+                else:
+                    await discord.PartialMessage(channel=self.bot.get_partial_messageable(channel_id, guild_id=guild_id), id=message_id).delete()
             except Exception as e:
                 print(str(guild_id))
                 print(str(channel_id))
                 print(str(message_id))
                 logging.warning(e)
 
+    async def delete_originals(self, deleted: list[int]):
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            async with con.transaction():
+                await SyncedMessages.delete_where_in('original_id', deleted, connection=con)
+                await OriginalMessages.delete_where_in('message_id', deleted, connection=con)
+
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_message(self, message: discord.Message):
+        if message.author.id == self.bot.user.id:
+            # It's the bot
+            return
+        if self.bot.is_own_webhook(message.webhook_id):
+            # It's one of our webhooks
+            return
         if message.guild is None:
             return
+        if self.bot.draining:
+            # Shutting down, anything new is left for the next start
+            return
+        await self.routing_ready.wait()
         channel_data = await self.get_channel_data(message.channel.id)
         if not channel_data:
             return
         link_data = await self.get_link_channels(channel_data['link_id'])
         if not link_data:
             return
-        if message.author.id == self.bot.user.id:
-            # It's the bot
-            return
-        if message.webhook_id is not None and message.webhook_id == (await self.bot.get_channel_webhook(message.channel)).id:
-            # It's the webhook
+        digest = (await self.get_link_data(channel_data['link_id']))['digest']
+        if message.id > self.last_seen.get(message.channel.id, 0):
+            self.last_seen[message.channel.id] = message.id
+        if not await self.store_original(message):
+            # Already relayed, catch-up can read messages that were seen before a crash
             return
-        async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            await con.execute(
-                "INSERT INTO original_messages(guild_id, channel_id, message_id, author_id) VALUES ($1, $2, $3, $4)",
-                message.guild.id,
-                message.channel.id,
-                message.id,
-                message.author.id
-            )
         reply = None
         mention_reply = False
         messages = []
         original = None
-        if message.reference is not None:
+        if message.reference is not None and not digest:
             reply = message.reference.cached_message
             if not reply:
                 reply = await discord.PartialMessage(channel=message.channel, id=message.reference.message_id).fetch()
-            original_id = message.reference.message_id
-            async with db.MaybeAcquire(pool=self.bot.pool) as con:
-                if reply.webhook_id is not None:
-                    data = await con.fetchrow("SELECT * FROM synced_messages WHERE message_id = $1;", reply.id)
-                    if data:
-                        original_id = data['original_id']
-                messages = await con.fetch(
-                    "SELECT * FROM synced_messages WHERE original_id = $1;", original_id
-                )
-                original = await con.fetchrow(
-                    "SELECT * FROM original_messages WHERE message_id = $1;", original_id
-                )
+            messages, original = await self.get_reply_rows(reply)
             if reply.webhook_id is not None:
                 mention_reply = message.content.startswith('@')
 
+        metrics.RELAY_FANOUT.observe(len(link_data) - 1)
+        basic = BasicMessage.from_message(message)
+        downloads = AttachmentFiles() if message.attachments else None
         for channel_row in link_data:
             guild_id = channel_row['guild_id']
             if await self.is_banned(guild_id, message.author.id):
@@ -469,14 +864,17 @@ class Link(commands.Cog):
                     pass
                 return
             channel_id = channel_row['channel_id']
-            if channel_id == message.channel.id:
+            if channel_id == message.channel.id or not self.health.available(channel_id):
                 continue
             channel = self.bot.get_channel(channel_id)
             if channel is None:
-                logging.warning("Channel ID " + channel_id + " cannot be found.")
+                self.channel_missing(channel_id, guild_id)
+                continue
+            if digest:
+                self.digests[channel_id].append(DigestEntry.from_message(message, basic.content))
                 continue
             webhooker = Webhooker(self.bot, channel)
-            # Create tasks so that they are run all at the same time
+            queue = self.get_relay_queue(channel_id)
             if reply is not None:
                 embed = Embed()
                 embed.set_author(name=reply.author.display_name, icon_url=reply.author.display_avatar.url)
@@ -491,27 +889,164 @@ class Link(commands.Cog):
                 if jump_url is None and original is not None:
                     jump_url = f'https://discord.com/channels/{original["guild_id"]}/{original["channel_id"]}/{original["message_id"]}'
                 embed.set_description(f"**[Reply To: ]({jump_url}) **{content}")
-                if mention_reply and original['channel_id'] == channel_id:
+                if mention_reply and original is not None and original['channel_id'] == channel_id:
                     mention = ' <@{0}>'.format(original['author_id'])
-                    self.bot.loop.create_task(self.send_message_and_db(webhooker, message, embed, append=mention))
+                    queue.put(RelayItem(webhooker, basic.copy(), message, embed=embed, append=mention, downloads=downloads))
                 else:
-                    self.bot.loop.create_task(self.send_message_and_db(webhooker, message, embed))
+                    queue.put(RelayItem(webhooker, basic.copy(), message, embed=embed, downloads=downloads))
             else:
-                self.bot.loop.create_task(self.send_message_and_db(webhooker, message, None))
+                queue.put(RelayItem(webhooker, basic.copy(), message, downloads=downloads))
 
-    async def send_message_and_db(self, webhooker: Webhooker, message: discord.Message, reply_embed, append=None):
-        try:
-            response: discord.WebhookMessage = await webhooker.send_message(BasicMessage.from_message(message), wait=True, embed=reply_embed, append=append)
-        except:
-            response: discord.WebhookMessage = await webhooker.send_message(BasicMessage.from_message(message), wait=True, embed=reply_embed, no_attachments=True, append=append)
+    async def get_reply_rows(self, reply: discord.Message) -> tuple[list, typing.Optional[dict]]:
+        """The mirrors and row of the original a reply points at, following a mirror back to it."""
+        if not self.spill.active:
+            try:
+                return await asyncio.wait_for(self.fetch_reply_rows(reply), self.db_timeout)
+            except db.UNAVAILABLE as e:
+                self.database_unavailable(e)
+        original_id = reply.id
+        if reply.webhook_id is not None and self.spill.synced_by_message.get(reply.id):
+            original_id = self.spill.synced_by_message[reply.id][0]['original_id']
+        return self.spill.synced_by_original.get(original_id, []), self.spill.originals.get(original_id)
+
+    async def fetch_reply_rows(self, reply: discord.Message) -> tuple[list, typing.Optional[dict]]:
+        original_id = reply.id
         async with db.MaybeAcquire(pool=self.bot.pool) as con:
-            await con.execute(
-                "INSERT INTO synced_messages(original_id, guild_id, channel_id, message_id) VALUES ($1, $2, $3, $4)",
-                message.id,
-                response.guild.id,
-                response.channel.id,
-                response.id,
+            if reply.webhook_id is not None:
+                data = await con.fetchrow("SELECT * FROM synced_messages WHERE message_id = $1;", reply.id)
+                if data:
+                    original_id = data['original_id']
+            messages = await con.fetch(
+                "SELECT * FROM synced_messages WHERE original_id = $1;", original_id
+            )
+            original = await con.fetchrow(
+                "SELECT * FROM original_messages WHERE message_id = $1;", original_id
+            )
+        return messages, original
+
+    @tasks.loop(seconds=10)
+    async def flush_digests(self):
+        digests, self.digests = self.digests, defaultdict(list)
+        await asyncio.gather(*(self.send_digest(channel_id, entries) for channel_id, entries in digests.items()))
+
+    async def drain_digests(self):
+        # A busy destination can hold more than one flush worth
+        while self.digests:
+            await self.flush_digests()
+
+    def channel_missing(self, channel_id: int, guild_id: typing.Optional[int]):
+        """Counts a destination that isn't cached against its health, unless its guild just hasn't arrived yet."""
+        logging.warning("Channel ID {0} cannot be found.".format(channel_id))
+        if not self.bot.is_ready():
+            return
+        guild = self.bot.get_guild(guild_id) if guild_id is not None else None
+        if guild is None or guild.unavailable:
+            return
+        self.health.failure(channel_id, 'Channel cannot be found')
+
+    async def send_digest(self, channel_id, entries: list[DigestEntry]):
+        if not self.health.available(channel_id):
+            return
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel_data = await self.get_channel_data(channel_id)
+            self.channel_missing(channel_id, channel_data['guild_id'] if channel_data else None)
+            return
+        webhooker = Webhooker(self.bot, channel)
+        digests, leftover = build_digests(entries, max_posts=self.digest_posts)
+        if leftover:
+            # Sent first on the next flush, ahead of anything newer
+            self.digests[channel_id][:0] = leftover
+        for embed, included in digests:
+            try:
+                response = await webhooker.send(
+                    username='Wormhole Digest', avatar_url=self.bot.user.display_avatar.url, embed=embed, wait=True,
+                )
+            except discord.HTTPException as e:
+                logging.warning('Failed sending digest to {0}: {1}'.format(channel_id, e))
+                self.health.failure(channel_id, e)
+                return
+            self.health.success(channel_id)
+            await self.store_synced([
+                {
+                    'original_id': entry.original.id, 'guild_id': channel.guild.id, 'channel_id': channel_id,
+                    'message_id': response.id, 'webhook_id': response.webhook_id, 'digest': True,
+                }
+                for entry in included
+            ])
+
+    def get_relay_queue(self, channel_id) -> RelayQueue:
+        queue = self.relay_queues.get(channel_id)
+        if queue is None:
+            queue = RelayQueue(
+                self.send_message_and_db, concurrency=self.bot.webhook_pool_size, coalesce=self.coalesce, on_failure=self.relay_failed,
+            )
+            self.relay_queues[channel_id] = queue
+        return queue
+
+    async def send_message_and_db(self, item: RelayItem):
+        webhooker = item.webhooker
+        kwargs = {'wait': True, 'embed': item.embed, 'append': item.append, 'downloads': item.downloads, 'max_posts': self.attachment_posts}
+        try:
+            responses: list[WebhookResponse] = await webhooker.send_message(item.message, **kwargs)
+        except discord.HTTPException as e:
+            if e.status != 413:
+                raise
+            # The upload limit was lower than planned for, links always fit
+            responses: list[WebhookResponse] = await webhooker.send_message(item.message, no_attachments=True, **kwargs)
+        await self.store_synced([
+            {
+                'original_id': original.id, 'guild_id': webhooker.channel.guild.id, 'channel_id': response.channel_id,
+                'message_id': response.id, 'webhook_id': response.webhook_id, 'digest': False,
+            }
+            for original in item.originals for response in responses
+        ])
+        self.health.success(webhooker.channel.id)
+        channel_data = await self.get_channel_data(webhooker.channel.id)
+        metrics.RELAY_LATENCY.observe(
+            (utils.utcnow() - item.originals[0].created_at).total_seconds(), link=channel_data['link_id'] if channel_data else '',
+        )
+
+    async def relay_failed(self, item: RelayItem, error: Exception):
+        self.health.failure(item.webhooker.channel.id, error)
+        await self.outbox.enqueue(item, error)
+
+    @tasks.loop(seconds=30)
+    async def probe_destinations(self):
+        for channel_id in self.health.due():
+            try:
+                await self.probe(channel_id)
+            except Exception as e:
+                self.health.failure(channel_id, e)
+            else:
+                self.health.success(channel_id)
+
+    async def probe(self, channel_id):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(channel_id)
+        # Relaying only needs the webhooks, loading them again checks permissions and replaces deleted ones
+        self.bot.get_webhook_pool.invalidate(self.bot, channel)
+        await self.bot.get_webhook_pool(channel)
+
+    def destination_opened(self, channel_id, error):
+        if self.notify_owners:
+            self.bot.loop.create_task(self.notify_owner(channel_id, error))
+
+    async def notify_owner(self, channel_id, error):
+        """Tells the owner of the destination's guild why their channel stopped getting messages."""
+        channel_data = await self.get_channel_data(channel_id)
+        guild = self.bot.get_guild(channel_data['guild_id']) if channel_data else None
+        if guild is None:
+            return
+        try:
+            owner = guild.owner or await self.bot.fetch_user(guild.owner_id)
+            await owner.send(
+                "I can't relay messages to <#{0}> (`{0}`) in **{1}** anymore, so it is paused until it works again. "
+                "Make sure I can see the channel and manage its webhooks.\n```\n{2}\n```".format(channel_id, guild, error)
             )
+        except discord.HTTPException as e:
+            logging.warning('Failed notifying the owner of {0}: {1}'.format(guild.id, e))
 
 
 async def setup(bot):
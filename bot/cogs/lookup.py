@@ -5,7 +5,7 @@ from discord import app_commands
 from discord.ext import commands
 
 from bot.core.embed import Embed
-from bot.util import database as db
+from bot.util import database as db, metrics
 
 
 class Lookup(commands.Cog):
@@ -24,6 +24,7 @@ class Lookup(commands.Cog):
         self.bot.tree.add_command(self.info_menu)
 
     @commands.Cog.listener()
+    @metrics.timed_event
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         if payload.guild_id is None:
             return
@@ -39,14 +40,15 @@ class Lookup(commands.Cog):
         async with db.MaybeAcquire(pool=self.bot.pool) as con:
             message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", payload.message_id)
             if not message_data:
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", payload.message_id)
+                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id IN (SELECT original_id FROM synced_messages WHERE message_id = $1) ORDER BY message_id LIMIT 1;", payload.message_id)
             if not message_data:
                 # Doesn't exist anywhere
                 return
         guild = self.bot.get_guild(message_data['guild_id'])
         event_guild = self.bot.get_guild(payload.guild_id)
         if emoji == '❓':
-            event_author = event_guild.get_member(payload.user_id)
+            # The gateway sends the reacting member along, the lookup is for when it doesn't
+            event_author = payload.member or await self.bot.members.fetch(event_guild, payload.user_id)
             try:
                 await self.send_user_info(event_author, event_guild, message_data, guild)
             except:
@@ -68,7 +70,7 @@ class Lookup(commands.Cog):
         async with db.MaybeAcquire(pool=self.bot.pool) as con:
             message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", message.id)
             if not message_data:
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", message.id)
+                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id IN (SELECT original_id FROM synced_messages WHERE message_id = $1) ORDER BY message_id LIMIT 1;", message.id)
             if not message_data:
                 # Doesn't exist anywhere
                 return await interaction.response.send_message("I couldn't find information on this message.", ephemeral=True)
@@ -91,7 +93,7 @@ class Lookup(commands.Cog):
         async with db.MaybeAcquire(pool=self.bot.pool) as con:
             message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = $1;", message.id)
             if not message_data:
-                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id = (SELECT original_id FROM synced_messages WHERE message_id = $1);", message.id)
+                message_data = await con.fetchrow("SELECT * FROM original_messages WHERE message_id IN (SELECT original_id FROM synced_messages WHERE message_id = $1) ORDER BY message_id LIMIT 1;", message.id)
             if not message_data:
                 # Doesn't exist anywhere
                 return await interaction.response.send_message("I couldn't find information on this message.", ephemeral=True)
@@ -110,7 +112,8 @@ class Lookup(commands.Cog):
         if channel is None:
             await guild.fetch_channel(message_data['channel_id'])
         embed = Embed()
-        embed.set_description("You got mentioned by <@{0}> (`{1}`)".format(event_author_id, event_guild.get_member(event_author_id)))
+        event_author = await self.bot.members.fetch(event_guild, event_author_id)
+        embed.set_description("You got mentioned by <@{0}> (`{1}`)".format(event_author_id, event_author))
         await channel.send(f"<@{message_data['author_id']}>", embed=embed)
         if channel_id == message_data['channel_id']:
             return
@@ -123,11 +126,13 @@ class Lookup(commands.Cog):
         dm = event_author.dm_channel
         if dm is None:
             dm = await event_author.create_dm()
-        author = event_guild.get_member(message_data['author_id'])
+        author = self.bot.members.get(event_guild, message_data['author_id'])
+        if not author and guild is not None:
+            author = await self.bot.members.fetch(guild, message_data['author_id'])
         if not author:
             author = self.bot.get_user(message_data['author_id'])
         if not author:
-            await dm.send("User `" + message_data['author_id'] + "` cannot be found in any guilds I am in. They probably have left.")
+            await dm.send("User `{0}` cannot be found in any guilds I am in. They probably have left.".format(message_data['author_id']))
         else:
             embed = Embed()
             embed.set_author(name=str(author), icon_url=author.display_avatar)
@@ -136,7 +141,7 @@ class Lookup(commands.Cog):
         if guild is not None:
             embed = Embed()
             embed.set_author(name=guild.name, icon_url=guild.icon.url if guild.icon is not None else None)
-            embed.set_description(f"ID: `{guild.id}`\nMembers: `{len(guild.members)}`")
+            embed.set_description(f"ID: `{guild.id}`\nMembers: `{guild.member_count}`")
             channel = guild.get_channel(message_data['channel_id'])
             if channel is None:
                 await guild.fetch_channel(message_data['channel_id'])
@@ -1,13 +1,16 @@
 import secrets
+import typing
 from collections import defaultdict
 
 import discord
 from discord.ext import commands
 
+import bot as bot_global
 from bot.core.context import Context
 from bot.core.embed import Embed
 from bot.util import database as db
 from bot.util.cache import ExpiringDict
+from bot.util.webhooker import Webhooker, pull_embed
 from bot.wormhole import Wormhole
 
 
@@ -45,7 +48,7 @@ class Management(commands.Cog):
         self.bot.get_link_cog().get_channel_data.invalidate(self.bot.get_link_cog(), channel.id)
         self.bot.get_link_cog().get_link_channels.invalidate(self.bot.get_link_cog(), link_id)
         self.bot.get_link_cog().get_link_data.invalidate(self.bot.get_link_cog(), link_id)
-        self.bot.get_link_cog().bot.get_channel_webhook.invalidate(self.bot.get_link_cog(), channel)
+        self.bot.get_webhook_pool.invalidate(self.bot, channel)
         await ctx.send("Entanglement complete!")
         channels = await self.bot.get_link_cog().get_link_channels(link_id)
         embed = Embed()
@@ -160,6 +163,67 @@ class Management(commands.Cog):
             ephemeral=True
             )
 
+    @commands.hybrid_command("digest")
+    async def digest(self, ctx: Context, channel: discord.TextChannel, enabled: bool):
+        """Delivers a link's messages as periodic digests instead of one by one
+
+        :param channel: A channel in the link
+        :param enabled: Whether the link should be sent as digests
+        """
+        if ctx.guild is None:
+            return await ctx.send("You have to be in the guild!", ephemeral=True)
+        if not ctx.author.guild_permissions.manage_guild:
+            return await ctx.send("You do not have permission to change a link!", ephemeral=True)
+        channel_data = await self.bot.get_link_cog().get_channel_data(channel.id)
+        if channel_data is None:
+            return await ctx.send("That channel is not linked!", ephemeral=True)
+        link_data = await self.bot.get_link_cog().get_link_data(channel_data['link_id'])
+        if link_data['owner_guild'] != ctx.guild.id:
+            return await ctx.send("This guild does not own the link!", ephemeral=True)
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await con.execute("UPDATE links SET digest = $1 WHERE id = $2;", enabled, channel_data['link_id'])
+        self.bot.get_link_cog().get_link_data.invalidate(self.bot.get_link_cog(), channel_data['link_id'])
+        await ctx.send("Digest mode is now {0}.".format('on' if enabled else 'off'), ephemeral=True)
+
+    @commands.hybrid_command("pull")
+    async def pull(self, ctx: Context, channel: discord.TextChannel, start: typing.Optional[discord.Message] = None, limit: int = 1000):
+        """Copies a channel's history into a new thread here
+
+        :param channel: The channel to copy from
+        :param start: The first message to copy, defaults to the start of the channel
+        :param limit: How many messages to copy at most
+        """
+        if ctx.guild is None or channel.guild.id != ctx.guild.id:
+            return await ctx.send("You have to be in the guild!", ephemeral=True)
+        if not isinstance(ctx.channel, discord.TextChannel):
+            return await ctx.send("It has to be pulled into a full text channel!", ephemeral=True)
+        if not ctx.author.guild_permissions.manage_guild:
+            return await ctx.send("You do not have permission to pull messages!", ephemeral=True)
+        if not channel.permissions_for(ctx.author).read_message_history:
+            return await ctx.send("You can't read that channel's history!", ephemeral=True)
+        if start is not None and start.channel.id != channel.id:
+            return await ctx.send("That message isn't in the channel!", ephemeral=True)
+        limit = min(max(limit, 1), bot_global.config.get('pull_max_messages', 50000))
+        if start is None:
+            async for start in channel.history(limit=1, oldest_first=True):
+                break
+            else:
+                return await ctx.send("That channel has no messages!", ephemeral=True)
+
+        header = await ctx.send(embed=pull_embed(ctx.author, None, start))
+        thread = await header.create_thread(name='Pulled from #{0}'.format(channel.name)[:100])
+        # Edited through the channel, an interaction's token expires long before a big pull is done
+        header = ctx.channel.get_partial_message(header.id)
+
+        async def progress(read, posted):
+            embed = pull_embed(ctx.author, None, start)
+            embed.set_footer(text='{0} of up to {1} messages read, {2} posts sent'.format(read, limit, posted))
+            await header.edit(embed=embed)
+
+        history = channel.history(after=discord.Object(id=start.id - 1), oldest_first=True, limit=limit)
+        read, _ = await Webhooker(self.bot, ctx.channel).send_stream(history, thread=thread, progress=progress)
+        await header.edit(embed=pull_embed(ctx.author, read, start))
+
     @commands.hybrid_command("linkban")
     async def link_ban(self, ctx: Context, user: discord.User):
         """Bans a user from using any links tied to this server
@@ -197,7 +261,7 @@ class Management(commands.Cog):
         self.bot.get_link_cog().get_channel_data.invalidate(self.bot.get_link_cog(), channel.id)
         self.bot.get_link_cog().get_link_channels.invalidate(self.bot.get_link_cog(), link_id)
         self.bot.get_link_cog().get_link_data.invalidate(self.bot.get_link_cog(), link_id)
-        self.bot.get_link_cog().bot.get_channel_webhook.invalidate(self.bot.get_link_cog(), channel)
+        self.bot.get_webhook_pool.invalidate(self.bot, channel)
 
     @commands.hybrid_command("forceunlink")
     async def forceunlink(self, ctx: Context, channel_id: str):
@@ -231,7 +295,7 @@ class Management(commands.Cog):
         self.bot.get_link_cog().get_channel_data.invalidate(self.bot.get_link_cog(), channel.id)
         self.bot.get_link_cog().get_link_channels.invalidate(self.bot.get_link_cog(), link_id)
         self.bot.get_link_cog().get_link_data.invalidate(self.bot.get_link_cog(), link_id)
-        self.bot.get_link_cog().bot.get_channel_webhook.invalidate(self.bot.get_link_cog(), channel)
+        self.bot.get_webhook_pool.invalidate(self.bot, channel)
 
     @commands.hybrid_command("linkunban")
     async def link_unban(self, ctx: Context, user: discord.User):
@@ -1,6 +1,14 @@
+import asyncio
+import io
+from datetime import datetime
+
+import discord
 from discord.ext import commands
 
+import bot as bot_global
 from bot.core.context import Context
+from bot.util import memory
+from bot.util.profiling import LagWatchdog, SamplingProfiler
 from bot.wormhole import Wormhole
 
 
@@ -8,6 +16,18 @@ class Owner(commands.Cog):
 
     def __init__(self, bot):
         self.bot: Wormhole = bot
+        self.watchdog: LagWatchdog = None
+        self.profiling = False
+        self.allocations = memory.AllocationTracker()
+
+    async def cog_load(self):
+        self.watchdog = LagWatchdog(asyncio.get_running_loop(), threshold=bot_global.config.get('loop_lag_threshold_ms', 250) / 1000)
+        self.watchdog.start()
+
+    async def cog_unload(self):
+        self.watchdog.stop()
+        if self.allocations.tracing:
+            self.allocations.stop()
 
     async def cog_check(self, ctx: Context) -> bool:
         return await self.bot.is_owner(ctx.author)
@@ -15,9 +35,99 @@ class Owner(commands.Cog):
     @commands.is_owner()
     @commands.command('sync')
     async def sync_commands(self, ctx):
-        await self.bot.tree.sync()
+        await self.bot.sync_tree(force=True)
         await ctx.send('Done!')
 
+    @commands.is_owner()
+    @commands.command('profile')
+    async def profile(self, ctx: Context, seconds: float = 30, interval_ms: float = 5):
+        if self.profiling:
+            return await ctx.send('Already profiling.')
+        seconds = min(max(seconds, 1), 300)
+        self.profiling = True
+        try:
+            await ctx.send('Sampling the event loop for {0:g} seconds...'.format(seconds))
+            profiler = SamplingProfiler(interval=interval_ms / 1000)
+            await profiler.run(seconds)
+        finally:
+            self.profiling = False
+        data = io.BytesIO(profiler.collapsed().encode('utf-8'))
+        filename = 'profile-{0:%Y%m%d-%H%M%S}.collapsed'.format(datetime.now())
+        await ctx.send(
+            '{0} samples in {1} distinct stacks. Open it with speedscope or flamegraph.pl.'.format(profiler.samples, len(profiler.stacks)),
+            file=discord.File(data, filename=filename),
+        )
+
+    @commands.is_owner()
+    @commands.command('lag')
+    async def lag(self, ctx: Context, threshold_ms: float = None):
+        if threshold_ms is not None:
+            self.watchdog.threshold = threshold_ms / 1000
+        message = 'Threshold `{0:.0f} ms`, `{1}` stalls, worst `{2:.0f} ms`.'.format(
+            self.watchdog.threshold * 1000, self.watchdog.stalls, self.watchdog.worst * 1000,
+        )
+        if self.watchdog.last_stall is not None:
+            message += '\nLast: {0}'.format(self.watchdog.last_stall)
+        await ctx.send(message)
+
+    @commands.is_owner()
+    @commands.group('memory', invoke_without_command=True)
+    async def memory_report(self, ctx: Context):
+        lines = []
+        rss = memory.rss_bytes()
+        if rss is not None:
+            lines.append('RSS {0:.1f} MiB'.format(rss / 1024 / 1024))
+        lines.append('')
+        lines.append('{0:<45} {1:>8} {2:>10}'.format('Cache', 'Entries', 'KiB'))
+        for name, entries, size in memory.cache_report():
+            lines.append('{0:<45} {1:>8} {2:>10.1f}'.format(name[-45:], entries, size / 1024))
+        lines.append('')
+        lines.append('Guilds {0}, users {1}, members {2}, looked up members {3}, messages {4}, own webhooks {5}'.format(
+            len(self.bot.guilds),
+            len(self.bot.users),
+            sum(len(guild.members) for guild in self.bot.guilds),
+            len(self.bot.members.cache),
+            len(self.bot.cached_messages),
+            len(self.bot.webhook_ids),
+        ))
+        link = self.bot.get_link_cog()
+        if link is not None:
+            lines.append('Link: locked clears {0}, locked emoji clears {1}, invites {2}, relay queues {3}, queued digests {4}'.format(
+                len(link.locked_clears),
+                len(link.locked_emoji_clears),
+                len(link.invites),
+                len(link.relay_queues),
+                sum(len(entries) for entries in link.digests.values()),
+            ))
+        lines.append('')
+        lines.append('Live discord.py objects')
+        for name, count in memory.model_counts():
+            lines.append('{0:<45} {1:>8}'.format(name, count))
+        await self.send_report(ctx, '\n'.join(lines), 'memory')
+
+    @commands.is_owner()
+    @memory_report.command('trace')
+    async def memory_trace(self, ctx: Context, frames: int = 1):
+        """Starts tracemalloc, then shows what grew since the last call each time."""
+        if not self.allocations.tracing:
+            self.allocations.start(frames)
+            return await ctx.send('Tracing allocations with {0} frame(s), run this again later to see what grew.'.format(frames))
+        lines = [str(stat) for stat in self.allocations.diff(top=15)]
+        await self.send_report(ctx, '\n'.join(lines) or 'Nothing changed.', 'allocations')
+
+    @commands.is_owner()
+    @memory_report.command('stop')
+    async def memory_stop(self, ctx: Context):
+        self.allocations.stop()
+        await ctx.send('Stopped tracing allocations.')
+
+    @staticmethod
+    async def send_report(ctx: Context, text: str, name: str):
+        if len(text) < 1990:
+            return await ctx.send('```\n{0}\n```'.format(text))
+        data = io.BytesIO(text.encode('utf-8'))
+        await ctx.send(file=discord.File(data, filename='{0}-{1:%Y%m%d-%H%M%S}.txt'.format(name, datetime.now())))
+
 
 async def setup(bot):
     await bot.add_cog(Owner(bot))
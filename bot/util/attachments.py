@@ -0,0 +1,67 @@
+import asyncio
+import io
+
+import discord
+
+
+class AttachmentPlan:
+    """How a message's attachments go out to one destination.
+
+    ``uploads`` holds one group of attachments per post, the first group rides along with the
+    message itself. Anything in ``links`` is sent as a link instead of being uploaded.
+    """
+
+    __slots__ = ('uploads', 'links')
+
+    def __init__(self, uploads: list[list[discord.Attachment]], links: list[discord.Attachment]):
+        self.uploads = uploads
+        self.links = links
+
+    @property
+    def uploaded_bytes(self) -> int:
+        return sum(attachment.size for group in self.uploads for attachment in group)
+
+
+def plan_attachments(attachments: list[discord.Attachment], limit: int, *, max_files=10, max_posts=3) -> AttachmentPlan:
+    """Decides up front what gets uploaded, split over extra posts or linked.
+
+    Attachments over ``limit`` can never be uploaded so they are linked. The rest are packed
+    largest first into as few posts as possible, each within ``limit`` bytes and ``max_files``
+    files. Whatever does not fit in ``max_posts`` posts is linked as well.
+    """
+    order = {attachment.id: index for index, attachment in enumerate(attachments)}
+    links = [attachment for attachment in attachments if attachment.size > limit]
+    groups: list[list[discord.Attachment]] = []
+    sizes: list[int] = []
+    for attachment in sorted((a for a in attachments if a.size <= limit), key=lambda a: a.size, reverse=True):
+        for index, group in enumerate(groups):
+            if sizes[index] + attachment.size <= limit and len(group) < max_files:
+                group.append(attachment)
+                sizes[index] += attachment.size
+                break
+        else:
+            if len(groups) < max_posts:
+                groups.append([attachment])
+                sizes.append(attachment.size)
+            else:
+                links.append(attachment)
+    for group in groups:
+        group.sort(key=lambda a: order[a.id])
+    links.sort(key=lambda a: order[a.id])
+    return AttachmentPlan(groups, links)
+
+
+class AttachmentFiles:
+    """Downloads each attachment once, however many destinations upload it."""
+
+    def __init__(self):
+        self._downloads: dict[int, asyncio.Future] = {}
+
+    async def get(self, attachment: discord.Attachment) -> discord.File:
+        download = self._downloads.get(attachment.id)
+        if download is None:
+            download = self._downloads[attachment.id] = asyncio.ensure_future(attachment.read())
+        data = await download
+        return discord.File(
+            io.BytesIO(data), filename=attachment.filename, spoiler=attachment.is_spoiler(), description=attachment.description,
+        )
@@ -14,6 +14,15 @@ from functools import wraps
 
 from lru import LRU
 
+from bot.util import metrics
+
+# Every cache made by the decorator, by the function it wraps
+CACHES = {}
+metrics.gauge(
+    'wormhole_cache_entries', 'Entries held per cache.', ('cache',),
+    callback=lambda: {(name,): len(stored) for name, stored in CACHES.items()},
+)
+
 
 def _wrap_and_store_coroutine(parent_cache, key, coroutine_func):
     async def func():
@@ -80,20 +89,25 @@ def create_key(func, *args, **kwargs):
 # TODO remake this as a class
 def cache(maxsize=64, cache_object=None):  # noqa: C901,WPS212,WPS231
     def decorator(func):  # noqa: WPS212,WPS231
+        name = '{0.__module__}.{0.__qualname__}'.format(func)  # noqa: WPS609
         if cache_object is None:
-            internal_cache = LRU(maxsize)
+            internal_cache = LRU(maxsize, callback=lambda *_: metrics.CACHE_EVICTIONS.inc(cache=name))
         else:
             internal_cache = cache_object
+        CACHES[name] = internal_cache
 
         @wraps(func)
         def wrapper(*args, **kwargs):
             key = create_key(func, args, kwargs)
             stored_value = internal_cache.get(key, None)
             if stored_value is None:
+                metrics.CACHE_REQUESTS.inc(cache=name, result='miss')
                 stored_value = func(*args, **kwargs)
                 if inspect.isawaitable(stored_value):
                     return _wrap_and_store_coroutine(internal_cache, key, stored_value)
                 internal_cache[key] = stored_value  # noqa: WPS529
+            else:
+                metrics.CACHE_REQUESTS.inc(cache=name, result='hit')
 
             if asyncio.iscoroutinefunction(func):
                 return _wrap_new_coroutine(stored_value)
@@ -13,6 +13,13 @@ class Config:    # noqa: WPS110
         self.data = {}    # noqa: WPS110
         self.loadfile()
 
+    @classmethod
+    def from_dict(cls, data):    # noqa: WPS110
+        config = cls.__new__(cls)
+        config.config_file = None
+        config.data = data    # noqa: WPS110
+        return config
+
     def loadfile(self):
         try:
             data = self.config_file.read_text()    # noqa: WPS110
@@ -6,15 +6,21 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 # Credit from Rapptz from RoboDanny
 
+import asyncio
 import datetime
 import decimal
 import inspect
 import json
+import logging
 import pydoc
-from collections import OrderedDict
+import time
+import typing
+from collections import Counter, OrderedDict
 
 import asyncpg
 
+from bot.util import metrics
+
 
 class SchemaError(Exception):
     """An exception thrown if table can't exist"""
@@ -357,6 +363,106 @@ class PrimaryKeyColumn(Column):
         super().__init__(Integer(auto_increment=True), primary_key=True)
 
 
+class QueryLog:
+    """Settings and state for the slow query log, see :class:`InstrumentedConnection`."""
+
+    def __init__(self, *, threshold_ms=100, explain_after=3, acquire_threshold_ms=50):
+        self.threshold = threshold_ms / 1000
+        self.explain_after = explain_after
+        self.acquire_threshold = acquire_threshold_ms / 1000
+        self.offenders = Counter()
+        self.explained = set()
+
+    @staticmethod
+    def redact(args) -> str:
+        # Only the types, parameters carry message content and user ids
+        return ', '.join('${0}: {1}'.format(index, type(arg).__name__) for index, arg in enumerate(args, start=1))
+
+    def should_explain(self, query: str) -> bool:
+        self.offenders[query] += 1
+        if query in self.explained or self.offenders[query] < self.explain_after:
+            return False
+        self.explained.add(query)
+        return True
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """Times every statement and logs the ones slower than the query log threshold.
+
+    Once a statement has been slow ``explain_after`` times its plan is captured with
+    ``EXPLAIN (ANALYZE, BUFFERS)``. Anything but a SELECT is explained in a transaction that is
+    rolled back, so the statement does not run twice.
+    """
+    query_log: typing.Optional[QueryLog] = None
+
+    @classmethod
+    def with_query_log(cls, query_log: QueryLog) -> type:
+        """A subclass for one pool, so each pool keeps its own settings and offenders."""
+        return type(cls.__name__, (cls,), {'query_log': query_log, '__module__': cls.__module__})
+
+    async def _timed(self, method, query, args, kwargs, *, explain=True):
+        # Only statements that completed are timed. One that raised or was cancelled may have left the
+        # connection in an aborted transaction or mid teardown, where explaining it would only fail.
+        started = time.perf_counter()
+        result = await method(query, *args, **kwargs)
+        elapsed = time.perf_counter() - started
+        query_log = self.query_log
+        if query_log is not None and elapsed >= query_log.threshold:
+            logging.warning('Slow query ({0:.1f} ms): {1} [{2}]'.format(elapsed * 1000, ' '.join(query.split()), query_log.redact(args)))
+            if explain and query_log.should_explain(query):
+                await self._explain(query, args)
+        return result
+
+    async def _explain(self, query, args):
+        statement = 'EXPLAIN (ANALYZE, BUFFERS) ' + query
+        try:
+            if query.lstrip().upper().startswith('SELECT'):
+                rows = await super().fetch(statement, *args)
+            else:
+                transaction = self.transaction()
+                await transaction.start()
+                try:
+                    rows = await super().fetch(statement, *args)
+                finally:
+                    await transaction.rollback()
+        except Exception as e:
+            logging.warning('Could not explain {0}: {1}'.format(' '.join(query.split()), e))
+            return
+        logging.warning('Plan for repeatedly slow query {0}\n{1}'.format(' '.join(query.split()), '\n'.join(row[0] for row in rows)))
+
+    async def execute(self, query, *args, **kwargs):
+        # Without arguments this may be a script of several statements, which cannot be explained
+        return await self._timed(super().execute, query, args, kwargs, explain=bool(args))
+
+    async def executemany(self, command, args, **kwargs):
+        # There is no single set of arguments to explain with
+        started = time.perf_counter()
+        result = await super().executemany(command, args, **kwargs)
+        elapsed = time.perf_counter() - started
+        if self.query_log is not None and elapsed >= self.query_log.threshold:
+            logging.warning('Slow query ({0:.1f} ms, {1} rows): {2}'.format(elapsed * 1000, len(args), ' '.join(command.split())))
+        return result
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(super().fetch, query, args, kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(super().fetchrow, query, args, kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(super().fetchval, query, args, kwargs)
+
+
+# Raised when the database can't be reached or doesn't answer in time, as opposed to a bad query
+UNAVAILABLE = (
+    asyncio.TimeoutError,
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.InterfaceError,
+)
+
+
 class MaybeAcquire:
 
     def __init__(self, connection=None, cleanup=True, *, pool):
@@ -368,7 +474,16 @@ class MaybeAcquire:
     async def __aenter__(self) -> asyncpg.Connection:
         if self.connection is None:
             self._cleanup = True
+            started = time.perf_counter()
             self._connection = c = await self.pool.acquire()
+            waited = time.perf_counter() - started
+            metrics.DB_ACQUIRE.observe(waited)
+            # Set on the connection class when the pool was created with a query log
+            query_log = getattr(c, 'query_log', None)
+            if query_log is not None and waited >= query_log.acquire_threshold:
+                logging.warning('Waited {0:.1f} ms for a database connection ({1} of {2} in use)'.format(
+                    waited * 1000, self.pool.get_size() - self.pool.get_idle_size(), self.pool.get_max_size(),
+                ))
             return c
         return self.connection
 
@@ -377,6 +492,46 @@ class MaybeAcquire:
             await self.pool.release(self._connection)
 
 
+class Record:
+    """A decoded row. Subclasses are generated per table with a slot for each column."""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_row(cls, row) -> 'Record':
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, row[name] if name in row else None)
+        return record
+
+    def __getitem__(self, name):
+        # Lets a record stand in where an asyncpg.Record was indexed by column name
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.values() == other.values()
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(
+            self.__class__.__name__, ' '.join('{0}={1!r}'.format(name, getattr(self, name)) for name in self.__slots__),
+        )
+
+
 class TableMeta(type):
 
     def __new__(cls, name, parents, attributes, **kwargs):
@@ -405,6 +560,10 @@ class TableMeta(type):
 
         attributes['columns'] = columns
         attributes['tablename'] = tablename
+        attributes['column_names'] = tuple(column.name for column in columns)
+        attributes['Record'] = type('{0}Record'.format(name), (Record,), {
+            '__slots__': attributes['column_names'], '__module__': attributes.get('__module__'),
+        })
         return super().__new__(cls, name, parents, attributes)
 
     def __init__(cls, name, parents, dct, **kwargs):
@@ -416,6 +575,7 @@ class TableMeta(type):
 
 
 class Table(metaclass=TableMeta):
+    _pool = None
 
     @classmethod
     async def create_pool(cls, uri, **kwargs):
@@ -427,10 +587,11 @@ class Table(metaclass=TableMeta):
         -----------
         uri: str
             The PostgreSQL URI to connect to.
+        query_log: Optional[dict]
+            Settings for :class:`QueryLog`, turns on the slow query log.
         \*\*kwargs
             The arguments to forward to asyncpg.create_pool.
         """
-
         def _encode_jsonb(value):
             return json.dumps(value)
 
@@ -438,6 +599,11 @@ class Table(metaclass=TableMeta):
             return json.loads(value)
 
         old_init = kwargs.pop('init', None)
+        settings = kwargs.pop('query_log', None)
+        if settings is not None:
+            connection_class = kwargs.get('connection_class', InstrumentedConnection)
+            if issubclass(connection_class, InstrumentedConnection):
+                kwargs['connection_class'] = connection_class.with_query_log(QueryLog(**settings))
 
         async def init(con):
             await con.set_type_codec('jsonb', schema='pg_catalog', encoder=_encode_jsonb, decoder=_decode_jsonb,
@@ -484,10 +650,102 @@ class Table(metaclass=TableMeta):
     @classmethod
     async def create(cls, connection=None):
         sql = cls.create_table(overwrite=False)
-        print(sql)
+        logging.debug(sql)
         async with MaybeAcquire(connection=connection, pool=cls._pool) as con:
             await con.execute(sql)
 
     @classmethod
     def all_tables(cls):
-        return cls.__subclasses__()
\ No newline at end of file
+        return cls.__subclasses__()
+
+    @classmethod
+    def decode(cls, row) -> typing.Optional[Record]:
+        return None if row is None else cls.Record.from_row(row)
+
+    @classmethod
+    def _column(cls, name: str) -> Column:
+        for column in cls.columns:
+            if column.name == name:
+                return column
+        raise SchemaError('{0} has no column {1}'.format(cls.tablename, name))
+
+    @staticmethod
+    def _serial(column: Column) -> bool:
+        return column.primary_key and isinstance(column.column_type, Integer) and column.column_type.auto_increment
+
+    @classmethod
+    def _rows(cls, records, columns) -> tuple[tuple[str, ...], list[tuple]]:
+        """Turns dicts, records or tuples into tuples in column order, and works out the columns when not given."""
+        records = list(records)
+        if columns is None:
+            first = records[0] if records else {}
+            if isinstance(first, Record):
+                columns = first.__slots__
+            elif isinstance(first, dict):
+                columns = tuple(first)
+            else:
+                # Tuples fill every column except a SERIAL primary key
+                columns = tuple(column.name for column in cls.columns if not cls._serial(column))
+        columns = tuple(columns)
+        for name in columns:
+            cls._column(name)
+        rows = []
+        for record in records:
+            if isinstance(record, (dict, Record)):
+                rows.append(tuple(record[name] for name in columns))
+            else:
+                rows.append(tuple(record))
+        return columns, rows
+
+    @classmethod
+    async def insert_many(cls, records, *, columns=None, connection=None) -> int:
+        """Bulk loads rows with COPY. Much faster than INSERT for many rows, but a single conflict fails them all,
+        use :meth:`upsert_many` when rows may already exist."""
+        columns, rows = cls._rows(records, columns)
+        if not rows:
+            return 0
+        async with MaybeAcquire(connection=connection, pool=cls._pool) as con:
+            await con.copy_records_to_table(cls.tablename, records=rows, columns=columns)
+        return len(rows)
+
+    @classmethod
+    async def upsert_many(cls, records, *, conflict, columns=None, update=(), connection=None) -> int:
+        """Inserts rows, skipping those that clash on the ``conflict`` columns or updating their ``update`` columns."""
+        columns, rows = cls._rows(records, columns)
+        if not rows:
+            return 0
+        conflict = (conflict,) if isinstance(conflict, str) else tuple(conflict)
+        for name in conflict + tuple(update):
+            cls._column(name)
+        if update:
+            action = 'UPDATE SET {0}'.format(', '.join('{0} = EXCLUDED.{0}'.format(name) for name in update))
+        else:
+            action = 'NOTHING'
+        sql = 'INSERT INTO {0} ({1}) VALUES ({2}) ON CONFLICT ({3}) DO {4};'.format(
+            cls.tablename,
+            ', '.join(columns),
+            ', '.join('${0}'.format(index) for index in range(1, len(columns) + 1)),
+            ', '.join(conflict),
+            action,
+        )
+        async with MaybeAcquire(connection=connection, pool=cls._pool) as con:
+            await con.executemany(sql, rows)
+        return len(rows)
+
+    @classmethod
+    async def delete_where_in(cls, column: str, values, *, returning=False, connection=None):
+        """Deletes every row whose ``column`` is one of ``values`` in one statement.
+
+        Returns the deleted rows as records with ``returning``, otherwise how many were deleted.
+        """
+        cls._column(column)
+        values = list(values)
+        if not values:
+            return [] if returning else 0
+        sql = 'DELETE FROM {0} WHERE {1} = ANY($1)'.format(cls.tablename, column)
+        async with MaybeAcquire(connection=connection, pool=cls._pool) as con:
+            if returning:
+                rows = await con.fetch('{0} RETURNING {1};'.format(sql, ', '.join(cls.column_names)), values)
+                return [cls.Record.from_row(row) for row in rows]
+            status = await con.execute(sql + ';', values)
+        return int(status.split()[-1])
@@ -0,0 +1,56 @@
+import discord
+
+from bot.core.embed import Embed
+
+
+class DigestEntry:
+    __slots__ = ('original', 'author', 'content', 'attachments')
+
+    def __init__(self, original: discord.Message, author: discord.abc.User, content: str, attachments: list[discord.Attachment]):
+        self.original = original
+        self.author = author
+        self.content = content
+        self.attachments = attachments
+
+    @classmethod
+    def from_message(cls, message: discord.Message, content: str):
+        return cls(message, message.author, content, message.attachments)
+
+    def format(self) -> str:
+        line = '**{0}**: {1}'.format(discord.utils.escape_markdown(self.author.display_name), self.content)
+        for attachment in self.attachments:
+            line += ' [{0}]({1})'.format(attachment.filename, attachment.url)
+        return line
+
+
+def build_digests(
+    entries: list[DigestEntry], *, max_description=4096, max_posts=3,
+) -> tuple[list[tuple[Embed, list[DigestEntry]]], list[DigestEntry]]:
+    """Packs entries into as few embeds as their description limit allows.
+
+    At most ``max_posts`` embeds are built, so a destination never gets more than ``max_posts`` posts
+    a flush. The entries that didn't fit are returned alongside, in order, for the next flush.
+    """
+    groups: list[list[DigestEntry]] = []
+    lines: list[list[str]] = []
+    length = 0
+    packed = 0
+    for entry in entries:
+        line = entry.format()
+        if not groups or length + len(line) + 1 > max_description:
+            if len(groups) == max_posts:
+                break
+            groups.append([])
+            lines.append([])
+            length = 0
+        groups[-1].append(entry)
+        lines[-1].append(line)
+        length += len(line) + 1
+        packed += 1
+
+    digests = []
+    for group, group_lines in zip(groups, lines):
+        embed = Embed(description='\n'.join(group_lines), max_description=max_description, truncate_append='…')
+        embed.timestamp = group[0].original.created_at
+        digests.append((embed, group))
+    return digests, entries[packed:]
@@ -0,0 +1,75 @@
+"""
+Circuit breakers for relay destinations.
+
+A destination that keeps failing (lost permissions, deleted webhooks, a channel the bot can't see)
+is opened after ``threshold`` failures in a row and left out of relaying. Open destinations are
+probed again after a delay that doubles each time a probe fails, and close on the first success.
+"""
+import logging
+import time
+import typing
+
+from bot.util import metrics
+
+CIRCUIT_OPENS = metrics.counter('wormhole_circuit_opens_total', 'Destinations taken out of relaying after repeated failures.')
+
+
+class Circuit:
+    __slots__ = ('failures', 'open', 'delay', 'retry_at', 'error')
+
+    def __init__(self):
+        self.failures = 0
+        self.open = False
+        self.delay = 0.0
+        self.retry_at = 0.0
+        self.error = None
+
+
+class DestinationHealth:
+
+    def __init__(self, *, threshold=5, base_delay=60, max_delay=3600, on_open: typing.Callable[[int, str], None] = None):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Called with the destination and the last error when it is first opened
+        self.on_open = on_open
+        self.circuits: dict[int, Circuit] = {}
+        metrics.gauge('wormhole_circuits_open', 'Destinations currently left out of relaying.', callback=lambda: len(self.opened()))
+
+    def available(self, destination: int) -> bool:
+        circuit = self.circuits.get(destination)
+        return circuit is None or not circuit.open
+
+    def success(self, destination: int):
+        circuit = self.circuits.pop(destination, None)
+        if circuit is not None and circuit.open:
+            logging.info('Destination {0} recovered, relaying to it again.'.format(destination))
+
+    def failure(self, destination: int, error):
+        circuit = self.circuits.get(destination)
+        if circuit is None:
+            circuit = self.circuits[destination] = Circuit()
+        circuit.failures += 1
+        circuit.error = str(error)
+        if circuit.open:
+            # A probe failed, wait twice as long before the next one
+            circuit.delay = min(circuit.delay * 2, self.max_delay)
+            circuit.retry_at = time.monotonic() + circuit.delay
+            return
+        if circuit.failures < self.threshold:
+            return
+        circuit.open = True
+        circuit.delay = self.base_delay
+        circuit.retry_at = time.monotonic() + circuit.delay
+        CIRCUIT_OPENS.inc()
+        logging.warning('Destination {0} failed {1} times in a row, skipping it: {2}'.format(destination, circuit.failures, circuit.error))
+        if self.on_open is not None:
+            self.on_open(destination, circuit.error)
+
+    def opened(self) -> list[int]:
+        return [destination for destination, circuit in self.circuits.items() if circuit.open]
+
+    def due(self) -> list[int]:
+        """Open destinations whose next probe is due."""
+        now = time.monotonic()
+        return [destination for destination, circuit in self.circuits.items() if circuit.open and circuit.retry_at <= now]
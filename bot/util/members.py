@@ -0,0 +1,43 @@
+import typing
+
+import discord
+from lru import LRU
+
+from bot.util.cache import ExpiringDict
+
+
+class MemberLookup:
+    """Members on demand, for when discord.py's member cache is off.
+
+    Members seen recently, usually because they sent a message, are kept in a bounded LRU so memory
+    follows the active users instead of every member of every guild. Anything else is fetched once
+    and remembered, and users that are not members are remembered as missing for a while.
+    """
+
+    def __init__(self, *, maxsize=10000, missing_seconds=300):
+        self.cache = LRU(maxsize)
+        self.missing = ExpiringDict(seconds=missing_seconds)
+
+    def remember(self, member: discord.Member):
+        if isinstance(member, discord.Member):
+            self.cache[(member.guild.id, member.id)] = member
+
+    def get(self, guild: discord.Guild, user_id: int) -> typing.Optional[discord.Member]:
+        return guild.get_member(user_id) or self.cache.get((guild.id, user_id))
+
+    async def fetch(self, guild: discord.Guild, user_id: int) -> typing.Optional[discord.Member]:
+        member = self.get(guild, user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        if key in self.missing:
+            return None
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            self.missing[key] = True
+            return None
+        except discord.HTTPException:
+            return None
+        self.remember(member)
+        return member
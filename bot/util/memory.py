@@ -0,0 +1,120 @@
+"""
+Memory diagnostics: what the caches hold, which discord.py models are alive and where new
+allocations come from.
+"""
+import gc
+import sys
+import tracemalloc
+import types
+import typing
+from collections import Counter
+
+import asyncpg
+import discord
+from discord.http import HTTPClient
+from discord.state import ConnectionState
+
+from bot.util import cache
+
+# Shared objects every cached model points back to. Sizes stop here so a cache is only charged
+# for what it keeps alive by itself.
+SHARED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType,
+    discord.Client, ConnectionState, HTTPClient, discord.Guild, asyncpg.Pool,
+)
+
+
+def deep_sizeof(root, *, limit=1_000_000) -> int:
+    """Bytes reachable from ``root`` through containers and instance attributes.
+
+    Each object is counted once and the walk stops at :data:`SHARED_TYPES` and after ``limit``
+    objects, so this is an estimate of what the object holds, not of the whole heap.
+    """
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack and len(seen) < limit:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj, 0)
+        if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            stack.extend(gc.get_referents(obj))
+    return total
+
+
+def cache_report() -> list[tuple[str, int, int]]:
+    """``(name, entries, bytes)`` for every :func:`cache.cache`, largest first."""
+    rows = []
+    for name, stored in cache.CACHES.items():
+        items = list(stored.items())
+        rows.append((name, len(items), deep_sizeof(items)))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows
+
+
+MODEL_TYPES = (
+    discord.Guild, discord.abc.GuildChannel, discord.Thread, discord.Member, discord.User, discord.Role,
+    discord.Emoji, discord.Message, discord.PartialMessage, discord.Attachment, discord.Embed, discord.Reaction,
+    discord.Webhook,
+)
+
+
+def model_counts(top=15) -> list[tuple[str, int]]:
+    """Live discord.py models by class. Walks the whole heap, so it blocks for a moment."""
+    counts = Counter(type(obj).__qualname__ for obj in gc.get_objects() if isinstance(obj, MODEL_TYPES))
+    return counts.most_common(top)
+
+
+def rss_bytes() -> typing.Optional[int]:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class AllocationTracker:
+    """Diffs :mod:`tracemalloc` snapshots, each call compares against the one before."""
+
+    def __init__(self):
+        self.previous: typing.Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.previous = self.snapshot()
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    @staticmethod
+    def snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def diff(self, top=10) -> list[tracemalloc.StatisticDiff]:
+        current = self.snapshot()
+        previous, self.previous = self.previous, current
+        if previous is None:
+            return []
+        return current.compare_to(previous, 'lineno')[:top]
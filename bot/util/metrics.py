@@ -0,0 +1,234 @@
+"""
+In-process counters, gauges and histograms, served in the Prometheus text format.
+
+Metrics are always collected, they are plain dict updates. The HTTP endpoint only runs when a
+``[metrics]`` table is in the config::
+
+    [metrics]
+    host = "127.0.0.1"
+    port = 9100
+"""
+import bisect
+import functools
+import logging
+import math
+import time
+import typing
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(key, _escape(value)) for key, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key: tuple, **extra) -> dict:
+        return {**dict(zip(self.labelnames, key)), **extra}
+
+    def samples(self) -> typing.Iterator[tuple[str, dict, float]]:
+        raise NotImplementedError()
+
+    def render(self) -> str:
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} {1}'.format(self.name, self.kind),
+        ]
+        for name, labels, value in self.samples():
+            lines.append('{0}{1} {2}'.format(name, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, self._labels(key), value
+
+
+class Gauge(Metric):
+    """A value that goes up and down. With ``callback`` it is read when scraped instead of set.
+
+    The callback returns either a number or a dict of label tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), *, callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.values: dict[tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                logging.exception('Failed collecting {0}'.format(self.name))
+                return
+            if not isinstance(values, dict):
+                values = {(): values}
+        for key, value in values.items():
+            yield self.name, self._labels(key), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), *, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self):
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield self.name + '_bucket', self._labels(key, le=_format_value(bound)), cumulative
+            yield self.name + '_sum', self._labels(key), total[0]
+            yield self.name + '_count', self._labels(key), cumulative
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # Registering a name again replaces it, so reloading an extension does not break scrapes
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), *, callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback=callback))
+
+
+def histogram(name, documentation, labelnames=(), *, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+
+RELAY_LATENCY = histogram(
+    'wormhole_relay_latency_seconds', 'Time from a message being sent to its mirror being posted.', ('link',),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300),
+)
+RELAY_FANOUT = histogram(
+    'wormhole_relay_fanout', 'Destinations a single message is relayed to.', buckets=(1, 2, 3, 5, 10, 20, 50),
+)
+RELAY_FAILURES = counter('wormhole_relay_failures_total', 'Relay posts that raised.')
+WEBHOOK_REQUESTS = counter('wormhole_webhook_requests_total', 'Webhook API requests by method and status.', ('method', 'status'))
+WEBHOOK_RATE_LIMITS = counter('wormhole_webhook_rate_limits_total', 'Webhook requests answered with a 429.')
+WEBHOOK_RETRY_AFTER = counter('wormhole_webhook_retry_after_seconds_total', 'Seconds spent sleeping off webhook 429s.')
+DISCORD_RATE_LIMITS = counter('wormhole_discord_rate_limits_total', "Rate limits hit by discord.py's own HTTP client.")
+CACHE_REQUESTS = counter('wormhole_cache_requests_total', 'Cache lookups by result.', ('cache', 'result'))
+CACHE_EVICTIONS = counter('wormhole_cache_evictions_total', 'Entries pushed out of a full cache.', ('cache',))
+DB_ACQUIRE = histogram(
+    'wormhole_db_acquire_seconds', 'Time spent waiting for a pool connection.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+EVENT_DURATION = histogram('wormhole_event_duration_seconds', 'Time spent in event handlers.', ('event',))
+
+
+def timed_event(func):
+    """Observes how long an event listener takes in :data:`EVENT_DURATION`, labelled with its name."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            EVENT_DURATION.observe(time.perf_counter() - started, event=func.__name__)
+    return wrapper
+
+
+class MetricsServer:
+
+    def __init__(self, registry: Registry = REGISTRY, *, host='127.0.0.1', port=9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: typing.Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type='text/plain', headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info('Serving metrics on http://{0}:{1}/metrics'.format(self.host, self.port))
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,213 @@
+"""
+Relays that failed to post, kept in the database and retried until they get through.
+
+Nothing is written while relaying works, a relay only lands here once its send raised. Workers
+claim due rows with ``FOR UPDATE SKIP LOCKED``, so they never retry the same row twice at once,
+and a row that keeps failing backs off exponentially until it is left in the ``dead`` state.
+Settings come from an optional ``[outbox]`` table in the config.
+"""
+import asyncio
+import logging
+import random
+
+import discord
+
+from bot.util import database as db, metrics
+from bot.util.relay import RelayItem
+from bot.util.webhooker import Webhooker, split_lines
+
+PENDING = 'pending'
+DEAD = 'dead'
+
+OUTBOX = metrics.counter('wormhole_outbox_total', 'Failed relays by what the outbox did with them.', ('result',))
+
+
+class OutboxEntries(db.Table, table_name='outbox'):
+    id = db.PrimaryKeyColumn()
+    # One row per original and destination, so a relay that fails repeatedly is only stored once
+    idempotency_key = db.Column(db.String(), unique=True)
+    channel_id = db.Column(db.Integer(big=True))
+    original_ids = db.Column(db.Array(db.Integer(big=True)))
+    payload = db.Column(db.JSON())
+    state = db.Column(db.String(), default=PENDING)
+    attempts = db.Column(db.Integer(), default=0)
+    next_attempt = db.Column(db.Datetime(timezone=True), default='now()')
+    last_error = db.Column(db.String())
+    created_at = db.Column(db.Datetime(timezone=True), default='now()')
+
+    @classmethod
+    def create_table(cls, overwrite=False):
+        statement = super().create_table(overwrite)
+        sql = "CREATE INDEX IF NOT EXISTS outbox_due_idx ON outbox (next_attempt) WHERE state = 'pending';"
+        return statement + '\n' + sql
+
+
+def relay_payload(item: RelayItem) -> dict:
+    """What :meth:`Webhooker.send_message` would have posted. Files aren't kept, attachments are retried as links."""
+    message = item.message
+    content = message.content
+    if content.startswith('@'):
+        content = content[1:]
+    if item.append:
+        content = content + item.append
+    links = '\n'.join(attachment.url for attachment in message.attachments)
+    if links:
+        content = (content + '\n' + links).strip()
+    embeds = message.embeds + ([item.embed] if item.embed else [])
+    return {
+        'username': message.author.display_name,
+        'avatar_url': str(message.author.display_avatar.url),
+        'contents': split_lines(content, 2000),
+        'embeds': [embed.to_dict() for embed in embeds],
+    }
+
+
+class Outbox:
+
+    def __init__(self, bot, *, workers=2, batch=10, max_attempts=8, base_delay=5, max_delay=3600, lease=60, poll_interval=10):
+        self.bot = bot
+        self.workers = workers
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        # Rows left over from before a restart are due again once their lease runs out
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, item: RelayItem, error: Exception):
+        channel_id = item.webhooker.channel.id
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await con.execute(
+                'INSERT INTO outbox (idempotency_key, channel_id, original_ids, payload, last_error, next_attempt) '
+                'VALUES ($1, $2, $3, $4, $5, now() + make_interval(secs => $6)) ON CONFLICT (idempotency_key) DO NOTHING;',
+                '{0}:{1}'.format(channel_id, item.originals[0].id),
+                channel_id,
+                [original.id for original in item.originals],
+                relay_payload(item),
+                repr(error),
+                float(self.base_delay),
+            )
+        OUTBOX.inc(result='enqueued')
+        self._wake.set()
+
+    async def _work(self):
+        # Channels come from the gateway, before it is ready every leftover row would look undeliverable
+        await self.bot.wait_until_ready()
+        while True:
+            try:
+                rows = await self.claim()
+            except Exception:
+                logging.exception('Failed claiming outbox entries')
+                rows = []
+            if not rows:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for row in rows:
+                try:
+                    await self.attempt(row)
+                except Exception:
+                    logging.exception('Failed retrying outbox entry {0}'.format(row['id']))
+
+    async def claim(self) -> list:
+        # Pushing next_attempt out by the lease keeps every other worker off the row meanwhile
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            return await con.fetch(
+                'UPDATE outbox SET attempts = attempts + 1, next_attempt = now() + make_interval(secs => $2) '
+                'WHERE id IN ('
+                "SELECT id FROM outbox WHERE state = 'pending' AND next_attempt <= now() "
+                'ORDER BY next_attempt LIMIT $1 FOR UPDATE SKIP LOCKED'
+                ') RETURNING *;',
+                self.batch,
+                float(self.lease),
+            )
+
+    async def attempt(self, row):
+        try:
+            await self.deliver(row)
+        except Exception as e:
+            await self.failed(row, e)
+            return
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await con.execute('DELETE FROM outbox WHERE id = $1;', row['id'])
+        OUTBOX.inc(result='delivered')
+
+    async def deliver(self, row):
+        channel = self.bot.get_channel(row['channel_id'])
+        if channel is None:
+            # Not cached, for instance in a guild that hasn't streamed in. NotFound or Forbidden are retried with backoff.
+            channel = await self.bot.fetch_channel(row['channel_id'])
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            # A send that got through before it raised already left its mirror behind
+            delivered = await con.fetchval(
+                'SELECT EXISTS (SELECT 1 FROM synced_messages WHERE original_id = ANY($1) AND channel_id = $2);',
+                row['original_ids'],
+                row['channel_id'],
+            )
+        if delivered:
+            return
+        payload = row['payload']
+        webhooker = Webhooker(self.bot, channel)
+        allowed_mentions = discord.AllowedMentions(everyone=False, users=True, roles=False)
+        responses = []
+        for index, content in enumerate(payload['contents'] or ['']):
+            embeds = [discord.Embed.from_dict(embed) for embed in payload['embeds']] if index == 0 else None
+            responses.append(await webhooker.send(
+                username=payload['username'],
+                avatar_url=payload['avatar_url'],
+                content=content or None,
+                embeds=embeds,
+                allowed_mentions=allowed_mentions,
+                wait=True,
+            ))
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await con.executemany(
+                "INSERT INTO synced_messages(original_id, guild_id, channel_id, message_id, webhook_id) VALUES ($1, $2, $3, $4, $5)",
+                [
+                    (original_id, channel.guild.id, response.channel_id, response.id, response.webhook_id)
+                    for original_id in row['original_ids'] for response in responses
+                ],
+            )
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        # Jitter so entries that failed together don't all retry together
+        return delay * random.uniform(0.75, 1.25)
+
+    async def failed(self, row, error: Exception):
+        if isinstance(error, discord.NotFound):
+            # Usually the webhook was deleted, the next attempt makes a new one
+            channel = self.bot.get_channel(row['channel_id'])
+            if channel is not None:
+                self.bot.get_webhook_pool.invalidate(self.bot, channel)
+        permanent = isinstance(error, discord.HTTPException) and error.status == 400
+        if permanent or row['attempts'] >= self.max_attempts:
+            state, delay = DEAD, 0.0
+            logging.warning('Giving up relaying outbox entry {0} after {1} attempts: {2!r}'.format(row['id'], row['attempts'], error))
+            OUTBOX.inc(result='dead')
+        else:
+            state, delay = PENDING, self.backoff(row['attempts'])
+            OUTBOX.inc(result='retried')
+        async with db.MaybeAcquire(pool=self.bot.pool) as con:
+            await con.execute(
+                'UPDATE outbox SET state = $2, next_attempt = now() + make_interval(secs => $3), last_error = $4 WHERE id = $1;',
+                row['id'],
+                state,
+                delay,
+                repr(error),
+            )
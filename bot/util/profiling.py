@@ -0,0 +1,131 @@
+"""
+Live diagnostics for the event loop that run beside it in threads, so they work while it is stuck.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import typing
+from collections import Counter
+
+from bot.util import metrics
+
+LOOP_LAG = metrics.histogram(
+    'wormhole_event_loop_lag_seconds', 'Delay before a callback scheduled on the event loop runs.',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+LOOP_STALLS = metrics.counter('wormhole_event_loop_stalls_total', 'Times the event loop was blocked past the threshold.')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    return '{0} ({1}:{2})'.format(name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def collapse(frame) -> str:
+    """A stack as ``root;...;leaf``, the format flamegraph.pl and speedscope read."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def describe_task(task: typing.Optional[asyncio.Task]) -> str:
+    if task is None:
+        return 'no task'
+    coro = task.get_coro()
+    return "task '{0}' running {1}".format(task.get_name(), getattr(coro, '__qualname__', repr(coro)))
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread, by default the one calling :meth:`run` from the loop."""
+
+    def __init__(self, thread_id: typing.Optional[int] = None, *, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample_for(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)  # noqa: WPS437
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+                self.samples += 1
+            del frame
+            time.sleep(self.interval)
+
+    async def run(self, seconds: float):
+        await asyncio.to_thread(self.sample_for, seconds)
+
+    def collapsed(self) -> str:
+        return ''.join('{0} {1}\n'.format(stack, count) for stack, count in self.stacks.most_common())
+
+
+class LagWatchdog:
+    """Pings the event loop from a thread and reports whatever kept it from answering in time.
+
+    Each ping schedules a callback with ``call_soon_threadsafe``. If it has not run within
+    ``threshold`` seconds, the loop thread's stack and the task it is running are captured, and a
+    warning with both is logged once the loop catches up.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, *, threshold=0.25, interval=0.5):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self.worst = 0.0
+        self.last_stall: typing.Optional[str] = None
+        self._loop_thread = threading.get_ident()
+        self._answered = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._answered.set()
+        self._thread = None
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            self._answered.clear()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(self._answered.set)
+            except RuntimeError:
+                # The loop is closed
+                return
+            if not self._answered.wait(self.threshold):
+                frame = sys._current_frames().get(self._loop_thread)  # noqa: WPS437
+                stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+                task = describe_task(asyncio.current_task(self.loop))
+                del frame
+                self._answered.wait()
+                if self._stopped.is_set():
+                    return
+                self._report(time.monotonic() - sent, task, stack)
+            else:
+                LOOP_LAG.observe(time.monotonic() - sent)
+            self._stopped.wait(self.interval)
+
+    def _report(self, lag: float, task: str, stack: str):
+        LOOP_LAG.observe(lag)
+        LOOP_STALLS.inc()
+        self.stalls += 1
+        self.worst = max(self.worst, lag)
+        self.last_stall = 'Event loop blocked for {0:.0f} ms in {1}'.format(lag * 1000, task)
+        logging.warning('{0}, stack when it passed {1:.0f} ms:\n{2}'.format(self.last_stall, self.threshold * 1000, stack))
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from collections import deque
+
+import discord
+
+from bot.util import metrics
+from bot.util.attachments import AttachmentFiles
+from bot.util.webhooker import BasicMessage, Webhooker
+
+
+class RelayItem:
+    """A single webhook post to a destination, standing in for one or more original messages."""
+
+    def __init__(
+            self,
+            webhooker: Webhooker,
+            message: BasicMessage,
+            original: discord.Message,
+            *,
+            embed=None,
+            append=None,
+            downloads: AttachmentFiles = None,
+    ):
+        self.webhooker = webhooker
+        self.message = message
+        self.source_id = original.channel.id
+        self.originals = [original]
+        self.embed = embed
+        self.append = append
+        self.downloads = downloads
+
+    @property
+    def plain(self) -> bool:
+        return not (self.message.embeds or self.message.attachments or self.embed or self.append)
+
+    def can_merge(self, other: 'RelayItem') -> bool:
+        return (
+            self.plain
+            and other.plain
+            and self.source_id == other.source_id
+            and self.message.author.id == other.message.author.id
+            and len(self.message.content) + len(other.message.content) < 2000
+        )
+
+    def merge(self, other: 'RelayItem'):
+        self.message.content = self.message.content + '\n' + other.message.content
+        self.originals.extend(other.originals)
+
+
+class RelayQueue:
+    """Outbound posts for one destination channel.
+
+    At most ``concurrency`` posts are in flight. Anything past that waits, and while it waits
+    consecutive plain text from the same author is merged into a single post, so a burst costs
+    fewer API calls exactly when the destination is falling behind.
+    """
+
+    def __init__(self, send, *, concurrency=1, coalesce=True, on_failure=None):
+        self.send = send
+        # Awaited with the item and the exception when a send raises
+        self.on_failure = on_failure
+        self.concurrency = concurrency
+        self.coalesce = coalesce
+        self.pending: deque[RelayItem] = deque()
+        self.active = 0
+        self.tasks: set[asyncio.Task] = set()
+
+    @property
+    def backed_up(self) -> bool:
+        return self.active >= self.concurrency
+
+    def put(self, item: RelayItem):
+        if not self.backed_up and not self.pending:
+            self._start(item)
+            return
+        if self.coalesce and self.pending and self.pending[-1].can_merge(item):
+            self.pending[-1].merge(item)
+            return
+        self.pending.append(item)
+
+    def _start(self, item: RelayItem):
+        self.active += 1
+        task = asyncio.create_task(self._run(item))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def drain(self):
+        """Waits until everything queued so far has been posted."""
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+
+    async def _run(self, item: RelayItem):
+        try:
+            await self.send(item)
+        except Exception as e:
+            metrics.RELAY_FAILURES.inc()
+            logging.exception('Failed relaying {0} message(s) to {1}'.format(len(item.originals), item.webhooker.channel.id))
+            if self.on_failure is not None:
+                try:
+                    await self.on_failure(item, e)
+                except Exception:
+                    logging.exception('Failed keeping a relay for retry')
+        finally:
+            self.active -= 1
+            if self.pending:
+                self._start(self.pending.popleft())
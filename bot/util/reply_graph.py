@@ -0,0 +1,106 @@
+"""
+Who replied to whom in a run of messages, indexed by id so every lookup is a dict access.
+
+Traversals use explicit stacks instead of recursion, so reply chains as long as the history
+itself work without hitting the recursion limit.
+"""
+import typing
+from collections import defaultdict
+
+import discord
+
+
+class ReplyGraph:
+    """Replies grouped under the message they belong to, with the reverse index for walking up."""
+
+    def __init__(self, children: dict[int, list[discord.Message]], messages: dict[int, discord.Message] = None):
+        self.children = children
+        self.messages = messages or {}
+        self.parents: dict[int, int] = {}
+        for parent, replies in children.items():
+            for reply in replies:
+                # A message listed under two parents belongs to whichever came first
+                self.parents.setdefault(reply.id, parent)
+
+    @classmethod
+    def from_messages(cls, messages: list[discord.Message], *, loose=False, depth=-1) -> 'ReplyGraph':
+        """Links each reply to the message it references when that message is in ``messages``.
+
+        With ``loose``, messages that aren't replies are chained onto the last reply (up to ``depth``
+        of them after each reply), since a conversation usually carries on without replying.
+        """
+        children = defaultdict(list)
+        by_id = {}
+        for message in messages:
+            by_id.setdefault(message.id, message)
+        last_found = None
+        remaining = depth
+        for message in messages:
+            if message.reference is not None:
+                if message.reference.message_id in by_id:
+                    children[message.reference.message_id].append(message)
+                    last_found = message.reference.message_id
+                    remaining = depth
+                continue
+            if remaining == 0:
+                continue
+            remaining -= 1
+            if loose and last_found is not None:
+                children[last_found].append(message)
+                last_found = message.id
+        return cls(children, by_id)
+
+    def parent(self, message_id: int) -> typing.Optional[int]:
+        return self.parents.get(message_id)
+
+    def root(self, message_id: int) -> typing.Optional[int]:
+        """The top of the thread ``message_id`` is in, or None when nothing is above it."""
+        found = None
+        seen = {message_id}
+        current = self.parents.get(message_id)
+        while current is not None and current not in seen:
+            seen.add(current)
+            found = current
+            current = self.parents.get(current)
+        return found
+
+    def extend(self, message_id: int, messages: list[discord.Message], *, depth=-1, orig_depth=-1):
+        """Appends everything below ``message_id`` to ``messages`` depth first, skipping what is already there.
+
+        ``depth`` counts the levels left to descend. A reply resets it to ``orig_depth`` for itself
+        and the siblings after it, so loose chains are cut off while explicit replies are followed.
+        """
+        if depth == 0:
+            return
+        seen = {message.id for message in messages}
+        # Each frame is the replies left to visit under one message and the depth they are at
+        stack = [[iter(self.children.get(message_id, ())), depth]]
+        while stack:
+            frame = stack[-1]
+            reply = next(frame[0], None)
+            if reply is None:
+                stack.pop()
+                continue
+            if reply.id in seen:
+                continue
+            seen.add(reply.id)
+            messages.append(reply)
+            if reply.reference is not None:
+                frame[1] = orig_depth
+            if frame[1] - 1 != 0:
+                stack.append([iter(self.children.get(reply.id, ())), frame[1] - 1])
+
+    def subtree(self, message_id: int, *, depth=-1) -> list[discord.Message]:
+        replies = []
+        self.extend(message_id, replies, depth=depth, orig_depth=depth)
+        return replies
+
+    def conversation(self, message_id: int, *, depth=-1) -> list[discord.Message]:
+        """The whole thread ``message_id`` belongs to, starting with its root."""
+        root = self.root(message_id)
+        if root is None:
+            root = message_id
+        start = self.messages.get(root)
+        messages = [start] if start is not None else []
+        self.extend(root, messages, depth=depth, orig_depth=depth)
+        return messages
@@ -0,0 +1,213 @@
+"""
+Keeps relaying going while PostgreSQL is down or too slow to answer.
+
+Writes that would have gone to ``original_messages`` and ``synced_messages`` are appended to a
+local JSON lines file instead, fsynced in batches, and indexed in memory so reactions, edits and
+deletes of those messages still find their mirrors. Once the database answers again the log is
+replayed into it and truncated. A log left behind by a crash is loaded and replayed on start.
+"""
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import typing
+from collections import defaultdict
+
+import asyncpg
+
+from bot.util import database as db, metrics
+
+ORIGINALS = 'original_messages'
+SYNCED = 'synced_messages'
+
+SPILLED = metrics.counter('wormhole_spill_rows_total', 'Rows written to the spill log while the database was unavailable.', ('table',))
+SPILL_REJECTED = metrics.counter('wormhole_spill_rejected_total', 'Spilled rows the database refused when they were replayed.', ('table',))
+
+
+class SpillLog:
+
+    def __init__(self, path='spill.jsonl', *, flush_interval=0.5):
+        self.path = pathlib.Path(path)
+        self.flush_interval = flush_interval
+        # Set on the first failed write, relaying skips the database until a replay succeeds
+        self.active = False
+        self.originals: dict[int, dict] = {}
+        self.synced_by_original: dict[int, list[dict]] = defaultdict(list)
+        self.synced_by_message: dict[int, list[dict]] = defaultdict(list)
+        self._buffer: list[str] = []
+        self._flush_task: typing.Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.originals or self.synced_by_message)
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with open(self.path) as spilled:
+            for line in spilled:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line of a crashed write
+                    continue
+                self._index(entry['table'], entry['row'])
+        if self.pending:
+            self.active = True
+            logging.warning('Loaded {0} spilled originals and {1} spilled mirrors from {2}.'.format(
+                len(self.originals), len(self.synced_by_message), self.path,
+            ))
+
+    def _index(self, table: str, row: dict):
+        if table == ORIGINALS:
+            self.originals[row['message_id']] = row
+        else:
+            self.synced_by_original[row['original_id']].append(row)
+            self.synced_by_message[row['message_id']].append(row)
+
+    def append(self, table: str, row: dict):
+        self._index(table, row)
+        self._buffer.append(json.dumps({'table': table, 'row': row}))
+        SPILLED.inc(table=table)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        # Everything appended meanwhile shares one fsync
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            lines, self._buffer = self._buffer, []
+            if lines:
+                await asyncio.to_thread(self._write, self.path, lines, 'a')
+
+    @staticmethod
+    def _write(path: pathlib.Path, lines: list[str], mode: str):
+        with open(path, mode) as spilled:
+            spilled.writelines(line + '\n' for line in lines)
+            spilled.flush()
+            os.fsync(spilled.fileno())
+
+    def _rewrite(self, lines: list[str]):
+        temporary = self.path.with_suffix(self.path.suffix + '.tmp')
+        self._write(temporary, lines, 'w')
+        os.replace(temporary, self.path)
+
+    def forget(self, original_ids: list[int]):
+        """Drops deleted originals and their mirrors so they aren't replayed."""
+        for original_id in original_ids:
+            self.originals.pop(original_id, None)
+            for row in self.synced_by_original.pop(original_id, ()):
+                rows = self.synced_by_message.get(row['message_id'], [])
+                if row in rows:
+                    rows.remove(row)
+                if not rows:
+                    self.synced_by_message.pop(row['message_id'], None)
+
+    def relayed(self, message_id: int) -> tuple[list[dict], list[dict]]:
+        """:meth:`Link.get_relayed` answered from the spilled rows alone."""
+        if message_id in self.originals:
+            original_ids = [message_id]
+        else:
+            original_ids = sorted({row['original_id'] for row in self.synced_by_message.get(message_id, ()) if not row['digest']})
+        originals = [self.originals[original_id] for original_id in original_ids if original_id in self.originals]
+        if not originals:
+            return [], []
+        mirror_ids = sorted({row['message_id'] for original_id in original_ids for row in self.synced_by_original.get(original_id, ())})
+        mirrors = []
+        for mirror_id in mirror_ids:
+            rows = sorted(self.synced_by_message[mirror_id], key=lambda row: row['original_id'])
+            mirrors.append({
+                'message_id': mirror_id,
+                'guild_id': rows[0]['guild_id'],
+                'channel_id': rows[0]['channel_id'],
+                'webhook_id': rows[0]['webhook_id'],
+                'digest': any(row['digest'] for row in rows),
+                'originals': [row['original_id'] for row in rows],
+                'original_channels': [self.originals.get(row['original_id'], {}).get('channel_id') for row in rows],
+            })
+        return originals, mirrors
+
+    async def replay(self, pool) -> int:
+        """Writes everything spilled into the database. Raises, keeping the log, if it is still unavailable.
+
+        Rows the database rejects, such as a mirror whose original is gone, are moved to a ``.rejected``
+        file next to the log so they don't hold back the rest.
+        """
+        await self.flush()
+        originals = list(self.originals.values())
+        synced = [row for rows in self.synced_by_message.values() for row in rows]
+        rejected = []
+        async with db.MaybeAcquire(pool=pool) as con:
+            try:
+                async with con.transaction():
+                    await self._insert(con, ORIGINALS, originals)
+                    await self._insert(con, SYNCED, synced)
+            except asyncpg.PostgresError as e:
+                if isinstance(e, db.UNAVAILABLE):
+                    raise
+                logging.warning('Replaying the spill log failed, retrying row by row: {0!r}'.format(e))
+                rejected = await self._insert_each(con, originals, synced)
+        if rejected:
+            await asyncio.to_thread(self._write, self.rejected_path, rejected, 'a')
+        async with self._lock:
+            # Rows spilled while the replay ran stay for the next one
+            for row in originals:
+                if self.originals.get(row['message_id']) is row:
+                    del self.originals[row['message_id']]
+            replayed = {id(row) for row in synced}
+            for index in (self.synced_by_original, self.synced_by_message):
+                for key in list(index):
+                    index[key] = [row for row in index[key] if id(row) not in replayed]
+                    if not index[key]:
+                        del index[key]
+            remaining = [json.dumps({'table': ORIGINALS, 'row': row}) for row in self.originals.values()]
+            remaining.extend(json.dumps({'table': SYNCED, 'row': row}) for rows in self.synced_by_message.values() for row in rows)
+            self._buffer = []
+            await asyncio.to_thread(self._rewrite, remaining)
+            self.active = self.pending
+        return len(originals) + len(synced) - len(rejected)
+
+    @property
+    def rejected_path(self) -> pathlib.Path:
+        return self.path.with_suffix(self.path.suffix + '.rejected')
+
+    @staticmethod
+    async def _insert(con, table: str, rows: list[dict]):
+        if table == ORIGINALS:
+            await con.executemany(
+                'INSERT INTO original_messages (guild_id, channel_id, message_id, author_id) VALUES ($1, $2, $3, $4) '
+                'ON CONFLICT (message_id) DO NOTHING;',
+                [(row['guild_id'], row['channel_id'], row['message_id'], row['author_id']) for row in rows],
+            )
+        else:
+            await con.executemany(
+                'INSERT INTO synced_messages (original_id, guild_id, channel_id, message_id, webhook_id, digest) '
+                'VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (original_id, message_id) DO NOTHING;',
+                [
+                    (row['original_id'], row['guild_id'], row['channel_id'], row['message_id'], row['webhook_id'], row['digest'])
+                    for row in rows
+                ],
+            )
+
+    async def _insert_each(self, con, originals: list[dict], synced: list[dict]) -> list[str]:
+        rejected = []
+        for table, rows in ((ORIGINALS, originals), (SYNCED, synced)):
+            for row in rows:
+                try:
+                    async with con.transaction():
+                        await self._insert(con, table, [row])
+                except asyncpg.PostgresError as e:
+                    if isinstance(e, db.UNAVAILABLE):
+                        raise
+                    rejected.append(json.dumps({'table': table, 'row': row, 'error': repr(e)}))
+                    SPILL_REJECTED.inc(table=table)
+        if rejected:
+            logging.warning('Moving {0} spilled rows the database rejected to {1}.'.format(len(rejected), self.rejected_path))
+        return rejected
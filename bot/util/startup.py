@@ -0,0 +1,85 @@
+"""
+Remembers what the last boot already did, so a restart can skip the slow idempotent steps.
+
+Digests of the table schemas and of the app command tree are stored in ``boot_state``. When they
+match on the next boot, the DDL and the rate limited global command sync are skipped.
+"""
+import hashlib
+import json
+import typing
+
+import asyncpg
+from discord import app_commands
+
+from bot.util import database as db
+
+SCHEMA = 'schema'
+COMMAND_TREE = 'command_tree'
+
+
+class BootState(db.Table, table_name='boot_state'):
+    name = db.Column(db.String(), primary_key=True)
+    digest = db.Column(db.String())
+
+
+def _digest(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def schema_digest(*extra: str) -> str:
+    """Every table's DDL plus any other setup SQL, in a stable order."""
+    tables = sorted(db.Table.all_tables(), key=lambda table: table.tablename)
+    return _digest([*extra, *(table.create_table(overwrite=False) for table in tables)])
+
+
+def _command_payload(command) -> dict:
+    # Built from attributes every discord.py 2.x has, Command.to_dict's signature changed between releases
+    payload = {
+        'name': command.name,
+        'type': getattr(command, 'type', None),
+        'description': getattr(command, 'description', None),
+        'guild_only': getattr(command, 'guild_only', False),
+        'nsfw': getattr(command, 'nsfw', False),
+        'default_permissions': getattr(getattr(command, 'default_permissions', None), 'value', None),
+    }
+    if isinstance(command, app_commands.Group):
+        payload['commands'] = [_command_payload(child) for child in command.commands]
+    elif isinstance(command, app_commands.Command):
+        payload['parameters'] = [
+            {
+                'name': parameter.display_name if hasattr(parameter, 'display_name') else parameter.name,
+                'description': parameter.description,
+                'type': parameter.type,
+                'required': parameter.required,
+                'choices': [(choice.name, choice.value) for choice in parameter.choices],
+                'channel_types': list(parameter.channel_types),
+                'min_value': parameter.min_value,
+                'max_value': parameter.max_value,
+                'autocomplete': bool(parameter.autocomplete),
+            }
+            for parameter in command.parameters
+        ]
+    return payload
+
+
+def tree_digest(tree: app_commands.CommandTree) -> str:
+    """What :meth:`CommandTree.sync` would upload for global commands, in a form that doesn't depend on the discord.py version."""
+    return _digest([_command_payload(command) for command in tree.get_commands()])
+
+
+async def get_digest(name: str, *, pool, connection=None) -> typing.Optional[str]:
+    async with db.MaybeAcquire(connection=connection, pool=pool) as con:
+        try:
+            return await con.fetchval('SELECT digest FROM boot_state WHERE name = $1;', name)
+        except asyncpg.UndefinedTableError:
+            # First boot, create_tables makes it along with the rest
+            return None
+
+
+async def set_digest(name: str, digest: str, *, pool, connection=None):
+    async with db.MaybeAcquire(connection=connection, pool=pool) as con:
+        await con.execute(
+            'INSERT INTO boot_state (name, digest) VALUES ($1, $2) ON CONFLICT (name) DO UPDATE SET digest = EXCLUDED.digest;',
+            name,
+            digest,
+        )
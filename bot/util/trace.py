@@ -0,0 +1,205 @@
+"""
+Records the gateway events the relay consumes so real traffic can be replayed offline.
+
+A trace is gzipped JSON lines. The first line is a header with what the replay needs to route
+messages the same way (links, linked channels, their guilds and the bot's own webhooks), every line
+after that is one dispatch: ``{"t": event name, "at": seconds since start, "d": raw payload}``.
+Replay it with ``python -m bench.replay``.
+
+With ``anonymize`` every snowflake is swapped for a stand-in, consistently within the trace. Only
+the low 22 bits change so ordering and message age survive. Content and names are left as is.
+"""
+import gzip
+import itertools
+import json
+import logging
+import pathlib
+import re
+import time
+import typing
+
+import discord
+
+import bot as bot_global
+from bot.util import database as db
+
+if typing.TYPE_CHECKING:
+    from bot.wormhole import Wormhole
+
+TRACED_EVENTS = frozenset({
+    'MESSAGE_CREATE',
+    'MESSAGE_UPDATE',
+    'MESSAGE_DELETE',
+    'MESSAGE_DELETE_BULK',
+    'MESSAGE_REACTION_ADD',
+    'MESSAGE_REACTION_REMOVE',
+    'MESSAGE_REACTION_REMOVE_ALL',
+    'MESSAGE_REACTION_REMOVE_EMOJI',
+    'TYPING_START',
+    'GUILD_BAN_ADD',
+    'GUILD_BAN_REMOVE',
+    'CHANNEL_DELETE',
+    'GUILD_DELETE',
+})
+
+# Config keys that change how the relay behaves, copied into the header so a replay matches
+RELAY_CONFIG = ('webhook_pool_size', 'relay_coalesce', 'attachment_max_posts', 'digest_max_posts', 'digest_interval')
+
+ID_KEYS = frozenset({'id', 'owner_guild'})
+ID_LIST_KEYS = frozenset({'ids', 'mention_roles', 'roles', 'webhook_ids'})
+MENTION = re.compile(r'<(@[!&]?|#)([0-9]{15,20})>')
+URL = re.compile(r'https?://[^\s<>()]+')
+# Channel, attachment and user ids inside CDN and message link paths
+SNOWFLAKE = re.compile(r'(?<![0-9])[0-9]{15,20}(?![0-9])')
+
+
+class Anonymizer:
+
+    def __init__(self):
+        self._ids: dict[int, int] = {}
+        self._counter = itertools.count(1)
+
+    def snowflake(self, value: int) -> int:
+        new = self._ids.get(value)
+        if new is None:
+            new = self._ids[value] = (value >> 22 << 22) | (next(self._counter) & 0x3FFFFF)
+        return new
+
+    def _value(self, value):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int):
+            return self.snowflake(value)
+        if isinstance(value, str) and value.isdigit():
+            return str(self.snowflake(int(value)))
+        return value
+
+    def _url(self, url: str) -> str:
+        # The query of a CDN url carries a signature that identifies the file, so it goes too
+        url = url.split('?', 1)[0]
+        return SNOWFLAKE.sub(lambda m: str(self.snowflake(int(m[0]))), url)
+
+    def _content(self, content: str) -> str:
+        content = MENTION.sub(lambda m: '<{0}{1}>'.format(m[1], self.snowflake(int(m[2]))), content)
+        return URL.sub(lambda m: self._url(m[0]), content)
+
+    def scrub(self, data):
+        """A copy of a payload with every snowflake replaced."""
+        if isinstance(data, list):
+            return [self.scrub(item) for item in data]
+        if isinstance(data, str) and URL.match(data):
+            return self._url(data)
+        if not isinstance(data, dict):
+            return data
+        scrubbed = {}
+        for key, value in data.items():
+            if key in ID_KEYS or key.endswith('_id'):
+                value = self._value(value)
+            elif key in ID_LIST_KEYS and isinstance(value, list):
+                value = [self.scrub(item) if isinstance(item, dict) else self._value(item) for item in value]
+            elif key == 'content' and isinstance(value, str):
+                value = self._content(value)
+            else:
+                value = self.scrub(value)
+            scrubbed[key] = value
+        return scrubbed
+
+
+def guild_payload(guild: discord.Guild) -> dict:
+    """The bare minimum of a GUILD_CREATE for the replay to resolve channels, roles and names."""
+    return {
+        'id': str(guild.id),
+        'name': guild.name,
+        'icon': None,
+        'member_count': guild.member_count,
+        'features': [],
+        'roles': [
+            {'id': str(role.id), 'name': role.name, 'permissions': str(role.permissions.value), 'position': role.position, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}
+            for role in guild.roles
+        ],
+        'channels': [
+            {'id': str(channel.id), 'name': channel.name, 'type': channel.type.value, 'position': channel.position, 'permission_overwrites': []}
+            for channel in guild.text_channels
+        ],
+        'members': [],
+        'threads': [],
+    }
+
+
+async def snapshot(bot: 'Wormhole') -> dict:
+    async with db.MaybeAcquire(pool=bot.pool) as con:
+        links = await con.fetch('SELECT id, owner_guild, digest FROM links;')
+        channels = await con.fetch('SELECT link_id, guild_id, channel_id, invite FROM channels;')
+        webhooks = await con.fetch('SELECT channel_id, webhook_id FROM webhooks;')
+    guilds = (bot.get_guild(guild_id) for guild_id in {row['guild_id'] for row in channels})
+    return {
+        'version': 1,
+        'user': {'id': str(bot.user.id), 'username': bot.user.name, 'discriminator': bot.user.discriminator, 'avatar': None, 'bot': True},
+        'config': {key: bot_global.config[key] for key in RELAY_CONFIG if key in bot_global.config},
+        'links': [dict(row) for row in links],
+        'channels': [dict(row) for row in channels],
+        'webhooks': [dict(row) for row in webhooks],
+        'guilds': [guild_payload(guild) for guild in guilds if guild is not None],
+    }
+
+
+class TraceRecorder:
+
+    def __init__(self, path, *, anonymize=False, max_events=0):
+        self.path = pathlib.Path(path)
+        self.anonymizer = Anonymizer() if anonymize else None
+        self.max_events = max_events
+        self.events = 0
+        self._file = None
+        self._started = 0.0
+
+    @property
+    def recording(self) -> bool:
+        return self._file is not None
+
+    def start(self, header: dict):
+        if self.anonymizer is not None:
+            header = self.anonymizer.scrub(header)
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._started = time.monotonic()
+        self._write(header)
+        logging.info('Recording gateway trace to {0}'.format(self.path))
+
+    def record(self, payload: typing.Union[str, bytes, dict]):
+        if self._file is None:
+            return
+        if isinstance(payload, (str, bytes)):
+            # socket_raw_receive hands over the frame before discord.py parses it
+            payload = json.loads(payload)
+        if payload.get('op') != 0 or payload.get('t') not in TRACED_EVENTS:
+            return
+        data = payload['d']
+        if self.anonymizer is not None:
+            data = self.anonymizer.scrub(data)
+        self._write({'t': payload['t'], 'at': round(time.monotonic() - self._started, 4), 'd': data})
+        self.events += 1
+        if self.max_events and self.events >= self.max_events:
+            self.stop()
+
+    def stop(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        logging.info('Stopped gateway trace after {0} events'.format(self.events))
+
+    def _write(self, line: dict):
+        self._file.write(json.dumps(line, separators=(',', ':')))
+        self._file.write('\n')
+
+
+def read_trace(path) -> tuple[dict, typing.Iterator[dict]]:
+    file = gzip.open(path, 'rt', encoding='utf-8')
+    header = json.loads(file.readline())
+
+    def events():
+        with file:
+            for line in file:
+                yield json.loads(line)
+
+    return header, events()
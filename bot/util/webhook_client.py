@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import time
+import typing
+
+import aiohttp
+import discord
+from discord.utils import MISSING
+
+from bot.util import metrics
+
+DISCORD_API = 'https://discord.com/api/v10'
+
+
+class WebhookResponse:
+    """The parts of a webhook message the relay cares about."""
+
+    __slots__ = ('id', 'channel_id', 'webhook_id', 'data')
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.id = int(data['id'])
+        self.channel_id = int(data['channel_id'])
+        self.webhook_id = int(data['webhook_id']) if data.get('webhook_id') else None
+
+
+class _Bucket:
+    __slots__ = ('remaining', 'reset_at')
+
+    def __init__(self):
+        self.remaining = 1
+        self.reset_at = 0.0
+
+    async def wait(self):
+        if self.remaining > 0:
+            return
+        delay = self.reset_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update(self, response: aiohttp.ClientResponse):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset_after = response.headers.get('X-RateLimit-Reset-After')
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_after is not None:
+            self.reset_at = time.monotonic() + float(reset_after)
+
+
+class WebhookClient:
+    """Executes webhooks directly by id and token on a connection pool of its own.
+
+    Relay traffic then never queues behind the bot's gateway bound HTTP client. Rate limits are
+    tracked per webhook from the response headers, and 429s are slept off and retried.
+    ``base_url`` can point at a local stand-in for testing.
+    """
+
+    def __init__(
+            self,
+            *,
+            base_url=DISCORD_API,
+            limit=100,
+            limit_per_host=50,
+            keepalive_timeout=60,
+            dns_ttl=300,
+            timeout=30,
+            max_retries=3,
+            allowed_mentions: typing.Optional[discord.AllowedMentions] = None,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.allowed_mentions = allowed_mentions
+        self.buckets: dict[int, _Bucket] = {}
+        self._session: typing.Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+            enable_cleanup_closed=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'User-Agent': 'Wormhole (https://github.com/DarkKronicle/Wormhole)'},
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def execute(
+            self,
+            webhook_id: int,
+            token: str,
+            *,
+            content=None,
+            username=None,
+            avatar_url=None,
+            embed=None,
+            embeds=None,
+            files=None,
+            allowed_mentions=None,
+            thread=None,
+            thread_name=None,
+            wait=True,
+    ) -> typing.Optional[WebhookResponse]:
+        payload = {}
+        if content is not None:
+            payload['content'] = str(content)
+        if username is not None:
+            payload['username'] = username
+        if avatar_url is not None:
+            payload['avatar_url'] = str(avatar_url)
+        if thread_name is not None:
+            payload['thread_name'] = thread_name
+        if embed is not None:
+            embeds = [embed]
+        if embeds:
+            payload['embeds'] = [e.to_dict() for e in embeds]
+        payload['allowed_mentions'] = self._allowed_mentions(allowed_mentions)
+        params = {'wait': 'true' if wait else 'false'}
+        if thread is not None:
+            params['thread_id'] = str(thread.id)
+        data = await self.request('POST', webhook_id, '/webhooks/{0}/{1}'.format(webhook_id, token), payload, files=files, params=params)
+        if data is None:
+            return None
+        return WebhookResponse(data)
+
+    async def edit_message(
+            self,
+            webhook_id: int,
+            token: str,
+            message_id: int,
+            *,
+            content=MISSING,
+            embed=MISSING,
+            embeds=MISSING,
+            allowed_mentions=None,
+            thread=MISSING,
+    ) -> WebhookResponse:
+        payload = {}
+        if content is not MISSING:
+            payload['content'] = str(content) if content is not None else None
+        if embed is not MISSING:
+            embeds = [embed] if embed is not None else []
+        if embeds is not MISSING:
+            payload['embeds'] = [e.to_dict() for e in embeds]
+        payload['allowed_mentions'] = self._allowed_mentions(allowed_mentions)
+        params = {}
+        if thread is not MISSING and thread is not None:
+            params['thread_id'] = str(thread.id)
+        path = '/webhooks/{0}/{1}/messages/{2}'.format(webhook_id, token, message_id)
+        return WebhookResponse(await self.request('PATCH', webhook_id, path, payload, params=params))
+
+    async def delete_message(self, webhook_id: int, token: str, message_id: int, *, thread=MISSING):
+        params = {}
+        if thread is not MISSING and thread is not None:
+            params['thread_id'] = str(thread.id)
+        path = '/webhooks/{0}/{1}/messages/{2}'.format(webhook_id, token, message_id)
+        await self.request('DELETE', webhook_id, path, params=params)
+
+    async def request(self, method, webhook_id, path, payload=None, *, files=None, params=None):
+        if self._session is None:
+            await self.start()
+        bucket = self.buckets.get(webhook_id)
+        if bucket is None:
+            bucket = self.buckets[webhook_id] = _Bucket()
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            await bucket.wait()
+            kwargs = {'params': params}
+            if files:
+                kwargs['data'] = self._form(payload, files)
+            elif payload is not None:
+                kwargs['json'] = payload
+            async with self._session.request(method, url, **kwargs) as response:
+                bucket.update(response)
+                metrics.WEBHOOK_REQUESTS.inc(method=method, status=response.status)
+                if response.status == 429:
+                    metrics.WEBHOOK_RATE_LIMITS.inc()
+                if response.status == 429 and attempt < self.max_retries:
+                    body = await self._body(response)
+                    retry_after = response.headers.get('Retry-After', 1)
+                    if isinstance(body, dict):
+                        retry_after = body.get('retry_after', retry_after)
+                    retry_after = float(retry_after)
+                    metrics.WEBHOOK_RETRY_AFTER.inc(retry_after)
+                    logging.info('Webhook {0} is being rate limited, retrying in {1:.2f} seconds.'.format(webhook_id, retry_after))
+                    await asyncio.sleep(retry_after)
+                    continue
+                if response.status == 204:
+                    return None
+                if 200 <= response.status < 300:
+                    return await response.json(content_type=None)
+                # Error bodies aren't always JSON, a proxy in front of Discord answers with HTML or plain text
+                data = await self._body(response)
+                if response.status == 403:
+                    raise discord.Forbidden(response, data)
+                if response.status == 404:
+                    raise discord.NotFound(response, data)
+                if response.status >= 500:
+                    raise discord.DiscordServerError(response, data)
+                raise discord.HTTPException(response, data)
+
+    @staticmethod
+    async def _body(response: aiohttp.ClientResponse) -> typing.Union[dict, str]:
+        text = await response.text()
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text
+
+    def _allowed_mentions(self, allowed_mentions: typing.Optional[discord.AllowedMentions]) -> dict:
+        if allowed_mentions is None:
+            allowed_mentions = self.allowed_mentions
+        elif self.allowed_mentions is not None:
+            allowed_mentions = self.allowed_mentions.merge(allowed_mentions)
+        if allowed_mentions is None:
+            return discord.AllowedMentions.all().to_dict()
+        return allowed_mentions.to_dict()
+
+    @staticmethod
+    def _form(payload: dict, files: list[discord.File]) -> aiohttp.FormData:
+        payload = dict(payload)
+        attachments = []
+        form = aiohttp.FormData()
+        for index, file in enumerate(files):
+            file.reset()
+            attachment = {'id': index, 'filename': file.filename}
+            if file.description is not None:
+                attachment['description'] = file.description
+            attachments.append(attachment)
+            form.add_field('files[{0}]'.format(index), file.fp, filename=file.filename, content_type='application/octet-stream')
+        payload['attachments'] = attachments
+        form.add_field('payload_json', json.dumps(payload), content_type='application/json')
+        return form
@@ -1,64 +1,68 @@
 from __future__ import annotations
+import asyncio
+import time
 import discord
 import typing
 from functools import wraps
 import re
-from collections import defaultdict
+from contextlib import asynccontextmanager
 
 from typing import Optional, TYPE_CHECKING
 
+from bot.util.attachments import AttachmentFiles, AttachmentPlan, plan_attachments
 from bot.util.clean_content import clean_content
+from bot.util.reply_graph import ReplyGraph
+from bot.util.webhook_client import WebhookResponse
+
+WEBHOOK_NAME = 'Wormhole Sender'
 
 
 def build_dict(messages: list[discord.Message], *, loose=False, depth=-1) -> dict[int, list[discord.Message]]:
-    pairs = defaultdict(list)
-    last_found = None
-    d = depth
-    for m in messages:
-        if m.reference is not None:
-            found = next((s for s in messages if s.id == m.reference.message_id), None)
-            if found is not None:
-                pairs[found.id].append(m)
-                last_found = found.id
-                d = depth
-        else:
-            if d == 0:
-                continue
-            d = d - 1
-            if loose and last_found is not None:
-                pairs[last_found].append(m)
-                last_found = m.id
-    return pairs
+    return ReplyGraph.from_messages(messages, loose=loose, depth=depth).children
 
 
 def get_referenced_from(reference: int, message_dict: dict[int, list[discord.Message]]) -> typing.Optional[int]:
-    for key, value in message_dict.items():
-        found = next((s for s in value if s.id == reference), None)
-        if found is not None:
-            return key
-    return None
+    return ReplyGraph(message_dict).parent(reference)
 
 
 def get_first_referenced(reference: int, message_dict: dict[int, list[discord.Message]]) -> int:
-    found = get_referenced_from(reference, message_dict)
-    f = None
-    while found is not None:
-        f = found
-        found = get_referenced_from(found, message_dict)
-    return f
+    return ReplyGraph(message_dict).root(reference)
 
 
 def extend_all(reference: int, message_dict: dict[int, list[discord.Message]], arr: list[discord.Message], depth=-1, orig_depth=-1) -> None:
-    if depth == 0:
-        return
-    for r in message_dict[reference]:
-        is_in = next((s for s in arr if s.id == r.id), None)
-        if is_in:
-            continue
-        arr.append(r)
-        if r.reference is not None:
-            depth = orig_depth
-        extend_all(r.id, message_dict, arr, depth - 1, orig_depth)
+    ReplyGraph(message_dict).extend(reference, arr, depth=depth, orig_depth=orig_depth)
+
+
+async def iterate(items: typing.Iterable):
+    for item in items:
+        yield item
+
+
+def pull_embed(creator: discord.Member, count: typing.Optional[int], first: discord.Message) -> discord.Embed:
+    """The header of a pull, ``count`` is None while it is still running."""
+    if count is None:
+        pulled = 'Pulling messages'
+    else:
+        pulled = 'Pulled {0} messages'.format(count)
+    embed = discord.Embed(
+        description="{0} {1} starting from **[here]({2})**".format(creator.mention, pulled, first.jump_url),
+        timestamp=first.created_at,
+    )
+    embed.set_author(icon_url=creator.display_avatar.url, name='Requested by {0}'.format(creator.display_name))
+    return embed
+
+
+def split_lines(content: str, limit: int) -> list[str]:
+    chunks = []
+    current = ''
+    for line in content.split('\n'):
+        if current and len(current) + len(line) + 1 > limit:
+            chunks.append(current)
+            current = ''
+        current = (current + '\n' + line if current else line)[:limit]
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 def ensure_webhook(func):
@@ -102,40 +106,120 @@ class BasicMessage:
         return cls(message.author, message.attachments, message.embeds, clean_content(message))
 
 
+class WebhookPool:
+    """The webhooks the bot owns in one channel.
+
+    Discord rate limits per webhook, so a busy channel spreads its sends over several of them.
+    Sends go to the least loaded webhook and the pool grows (up to ``max_size``) whenever every
+    webhook already has a send in flight.
+    """
+
+    def __init__(self, bot, channel: discord.TextChannel, webhooks: list[discord.Webhook], *, max_size=1):
+        self.bot = bot
+        self.channel = channel
+        self.webhooks = webhooks
+        self.max_size = max_size
+        self.load = {webhook.id: 0 for webhook in webhooks}
+        self._grow_lock = asyncio.Lock()
+
+    @property
+    def primary(self) -> discord.Webhook:
+        return self.webhooks[0]
+
+    def get(self, webhook_id: typing.Optional[int]) -> discord.Webhook:
+        for webhook in self.webhooks:
+            if webhook.id == webhook_id:
+                return webhook
+        return self.primary
+
+    def least_loaded(self) -> discord.Webhook:
+        return min(self.webhooks, key=lambda w: self.load[w.id])
+
+    async def acquire(self) -> discord.Webhook:
+        webhook = self.least_loaded()
+        if self.load[webhook.id] > 0 and len(self.webhooks) < self.max_size:
+            webhook = await self._grow()
+        self.load[webhook.id] += 1
+        return webhook
+
+    def release(self, webhook: discord.Webhook):
+        self.load[webhook.id] -= 1
+
+    @asynccontextmanager
+    async def lease(self):
+        webhook = await self.acquire()
+        try:
+            yield webhook
+        finally:
+            self.release(webhook)
+
+    async def _grow(self) -> discord.Webhook:
+        async with self._grow_lock:
+            # Another send may have grown the pool while we waited
+            webhook = self.least_loaded()
+            if self.load[webhook.id] == 0 or len(self.webhooks) >= self.max_size:
+                return webhook
+            try:
+                created = await self.channel.create_webhook(name=WEBHOOK_NAME)
+            except discord.HTTPException:
+                # Out of webhook slots or permissions, stick with what we have
+                self.max_size = len(self.webhooks)
+                return webhook
+            await self.bot.register_webhook(created)
+            self.webhooks.append(created)
+            self.load[created.id] = 0
+            return created
+
+
 class Webhooker:
 
     def __init__(self, bot, channel: discord.TextChannel):
         self.webhook: discord.Webhook = None
+        self.pool: WebhookPool = None
         self.channel = channel
         self.bot = bot
 
     async def setup_webhook(self):
-        if self.webhook is not None:
+        if self.pool is not None:
             return
-        self.webhook = await self.bot.get_channel_webhook(self.channel)
+        self.pool = await self.bot.get_webhook_pool(self.channel)
+        self.webhook = self.pool.primary
 
     @ensure_webhook
-    async def edit(self, message_id, thread=discord.utils.MISSING, **kwargs):
+    async def edit(self, message_id, thread=discord.utils.MISSING, webhook_id=None, **kwargs):
         # Can't modify what user looks like
         kwargs.pop('avatar_url', None)
         kwargs.pop('username', None)
-        return await self.webhook.edit_message(message_id, thread=thread, **kwargs)
+        # Only the webhook that sent a message can edit it
+        webhook = self.pool.get(webhook_id)
+        return await self.bot.webhook_client.edit_message(webhook.id, webhook.token, message_id, thread=thread, **kwargs)
 
     @ensure_webhook
-    async def send(self, thread=discord.utils.MISSING, **kwargs):
-        return await self.webhook.send(thread=thread, **kwargs)
+    async def send(self, thread=None, **kwargs) -> typing.Optional[WebhookResponse]:
+        async with self.pool.lease() as webhook:
+            return await self.bot.webhook_client.execute(webhook.id, webhook.token, thread=thread, **kwargs)
 
     @ensure_webhook
-    async def create_thread(self, name, **kwargs):
-        return await self.webhook.send(thread_name=name, **kwargs)
-
-    async def send_message(self, message: BasicMessage, *, no_attachments=False, thread=None, append=None, **kwargs) -> typing.Optional[discord.WebhookMessage]:
-        files = []
-        if not no_attachments:
-            for attachment in message.attachments:
-                files.append(await attachment.to_file())
-        if thread is None:
-            thread = discord.utils.MISSING
+    async def create_thread(self, name, **kwargs) -> typing.Optional[WebhookResponse]:
+        return await self.bot.webhook_client.execute(self.webhook.id, self.webhook.token, thread_name=name, **kwargs)
+
+    async def send_message(
+            self,
+            message: BasicMessage,
+            *,
+            no_attachments=False,
+            thread=None,
+            append=None,
+            downloads: AttachmentFiles = None,
+            max_posts=3,
+            **kwargs,
+    ) -> list[WebhookResponse]:
+        if no_attachments:
+            plan = AttachmentPlan([], list(message.attachments))
+        else:
+            plan = plan_attachments(message.attachments, self.channel.guild.filesize_limit, max_posts=max_posts)
+        if downloads is None:
+            downloads = AttachmentFiles()
         embed = kwargs.pop("embed", None)
         embeds = message.embeds
         if embed:
@@ -145,42 +229,56 @@ class Webhooker:
             content = content[1:]
         if append:
             content = content + append
-        return await self.mimic_user(
-            member=message.author,
-            embeds=embeds,
-            content=content,
-            allowed_mentions=discord.AllowedMentions(everyone=False, users=True, roles=False),
-            thread=thread,
-            files=files,
-            **kwargs,
-        )
+        extra_content = []
+        if plan.links:
+            links = '\n'.join(attachment.url for attachment in plan.links)
+            if len(content) + len(links) < 2000:
+                content = (content + '\n' + links).strip()
+            else:
+                extra_content = split_lines(links, 2000)
+        allowed_mentions = discord.AllowedMentions(everyone=False, users=True, roles=False)
+        responses = []
+        for index, group in enumerate(plan.uploads or [[]]):
+            files = [await downloads.get(attachment) for attachment in group]
+            if index == 0:
+                response = await self.mimic_user(
+                    member=message.author,
+                    embeds=embeds,
+                    content=content,
+                    allowed_mentions=allowed_mentions,
+                    thread=thread,
+                    files=files,
+                    **kwargs,
+                )
+            else:
+                response = await self.mimic_user(member=message.author, thread=thread, files=files, **kwargs)
+            responses.append(response)
+        for text in extra_content:
+            responses.append(await self.mimic_user(member=message.author, content=text, allowed_mentions=allowed_mentions, thread=thread, **kwargs))
+        return responses
 
     @ensure_webhook
-    async def mimic_user(self, member: discord.Member, **kwargs) -> typing.Optional[discord.WebhookMessage]:
+    async def mimic_user(self, member: discord.Member, **kwargs) -> typing.Optional[WebhookResponse]:
         new_kwargs = {}
         for key, value in kwargs.items():
             if value is not None:
                 if isinstance(value, str) and len(value) == 0:
                     continue
                 new_kwargs[key] = value
-        return await self.webhook.send(
-            username=member.display_name,
-            avatar_url=member.display_avatar.url,
-            **new_kwargs,
-        )
+        async with self.pool.lease() as webhook:
+            return await self.bot.webhook_client.execute(
+                webhook.id,
+                webhook.token,
+                username=member.display_name,
+                avatar_url=member.display_avatar.url,
+                **new_kwargs,
+            )
 
     @ensure_webhook
     async def send_channel_messages(self, messages: list[discord.Message], *, creator: discord.Member = None, thread: discord.Thread = None, interaction: discord.Interaction = None):
         if creator is None:
             creator = messages[0].author
-        embed = discord.Embed(
-            description="{0} Pulled {1} messages starting from **[here]({2})**".format(
-                creator.mention,
-                len(messages),
-                messages[0].jump_url),
-            timestamp=messages[0].created_at,
-        )
-        embed.set_author(icon_url=creator.display_avatar.url, name='Requested by {0}'.format(creator.display_name))
+        embed = pull_embed(creator, len(messages), messages[0])
         if interaction is not None:
             await interaction.edit_original_response(embed=embed)
         else:
@@ -188,32 +286,81 @@ class Webhooker:
                 await self.channel.send(embed=embed)
             else:
                 await thread.send(embed=embed)
-        for mes in self.flatten(messages):
-            await self.send_message(mes, thread=thread)
+        await self.send_stream(iterate(messages), thread=thread)
 
     @ensure_webhook
     async def create_thread_with_messages(self, messages: list[discord.Message], *, creator: discord.Member = None, interaction: discord.Interaction = None):
         if creator is None:
             creator = messages[0].author
-        embed = discord.Embed(
-            description="{0} Pulled {1} messages starting from **[here]({2})**".format(
-                creator.mention,
-                len(messages),
-                messages[0].jump_url),
-            timestamp=messages[0].created_at,
-        )
-        embed.set_author(icon_url=creator.display_avatar.url, name='Requested by {0}'.format(creator.display_name))
+        embed = pull_embed(creator, len(messages), messages[0])
         # Send through channel so we get good-looking message
         if interaction is not None:
             m = await interaction.edit_original_response(embed=embed)
         else:
             m = await self.channel.send(embed=embed)
-        name = messages[0].content
-        if not name:
-            name = 'Blank'
+        thread = await m.create_thread(name=get_name(messages[0].content) or 'Blank')
+        await self.send_stream(iterate(messages), thread=thread)
+
+    @ensure_webhook
+    async def send_stream(
+            self,
+            messages: typing.AsyncIterator[discord.Message],
+            *,
+            thread: discord.Thread = None,
+            buffer=25,
+            progress: typing.Callable[[int, int], typing.Awaitable] = None,
+            progress_interval=5,
+    ) -> tuple[int, int]:
+        """Flattens and posts messages while they are still being read.
+
+        Reading runs ahead of posting by at most ``buffer`` posts, so memory stays flat however long
+        the history is. ``progress(read, posted)`` is awaited at most every ``progress_interval``
+        seconds. Returns the final ``(read, posted)``.
+        """
+        queue: asyncio.Queue[typing.Optional[BasicMessage]] = asyncio.Queue(maxsize=buffer)
+        read = 0
+
+        async def counted():
+            nonlocal read
+            async for message in messages:
+                read += 1
+                yield message
+
+        async def produce():
+            try:
+                async for basic in self.flatten_stream(counted()):
+                    await queue.put(basic)
+            finally:
+                await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        posted = 0
+        reported = time.monotonic()
+        try:
+            while True:
+                basic = await queue.get()
+                if basic is None:
+                    break
+                await self.send_message(basic, thread=thread)
+                posted += 1
+                if progress is not None and time.monotonic() - reported >= progress_interval:
+                    reported = time.monotonic()
+                    await progress(read, posted)
+        finally:
+            producer.cancel()
+        # Reading errors surface here, once everything read before them is posted
+        if not producer.cancelled():
+            await producer
+        return read, posted
 
-        for mes in self.flatten(messages):
-            await self.send_message(mes, thread=thread)
+    @staticmethod
+    def can_flatten(previous: typing.Optional[BasicMessage], basic: BasicMessage) -> bool:
+        return (
+            previous is not None
+            and basic.author.id == previous.author.id
+            and not (basic.embeds or previous.embeds or basic.attachments or previous.attachments)
+            and len(previous.content) + len(basic.content) + 1 <= 2000
+        )
 
     @staticmethod
     def flatten(messages: list[discord.Message]):
@@ -221,22 +368,24 @@ class Webhooker:
         basic_messages = []
         for mes in messages:
             basic = BasicMessage.from_message(mes)
-            if (
-                    previous_message is None
-                    or
-                    basic.author.id != previous_message.author.id
-                    or
-                    not (len(basic.embeds) == 0 and len(previous_message.embeds) == 0)
-                    or
-                    not (len(basic.attachments) == 0 and len(previous_message.attachments) == 0)
-            ):
-                basic_messages.append(basic)
-                previous_message = basic
+            if Webhooker.can_flatten(previous_message, basic):
+                previous_message.content = previous_message.content + '\n' + basic.content
                 continue
-            new_content = previous_message.content + '\n' + basic.content
-            if len(new_content) > 2000:
-                basic_messages.append(basic)
-                previous_message = basic
-                continue
-            previous_message.content = new_content
+            basic_messages.append(basic)
+            previous_message = basic
         return basic_messages
+
+    @staticmethod
+    async def flatten_stream(messages: typing.AsyncIterator[discord.Message]) -> typing.AsyncIterator[BasicMessage]:
+        """:meth:`flatten` for an async iterator, each post is yielded once nothing more can join it."""
+        previous_message: BasicMessage = None
+        async for mes in messages:
+            basic = BasicMessage.from_message(mes)
+            if Webhooker.can_flatten(previous_message, basic):
+                previous_message.content = previous_message.content + '\n' + basic.content
+                continue
+            if previous_message is not None:
+                yield previous_message
+            previous_message = basic
+        if previous_message is not None:
+            yield previous_message
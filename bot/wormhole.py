@@ -1,3 +1,4 @@
+import asyncio
 import math
 import typing
 
@@ -10,7 +11,12 @@ from discord.ext import commands
 from datetime import datetime
 
 from bot.core.context import Context
+from bot.util import database as db, metrics, startup
 from bot.util.cache import cache
+from bot.util.members import MemberLookup
+from bot.util.trace import TraceRecorder, snapshot
+from bot.util.webhook_client import WebhookClient
+from bot.util.webhooker import WebhookPool, WEBHOOK_NAME
 
 startup_extensions = (
     'bot.cogs.link',
@@ -26,17 +32,35 @@ class Wormhole(commands.Bot):
         self.debug = bot_global.config.get('debug', False)
         self.pool = pool
         allowed_mentions = discord.AllowedMentions(roles=False, everyone=False, users=True)
-        intents = discord.Intents(
-            guilds=True,
-            members=True,
-            bans=True,
-            emojis=True,
-            voice_states=True,
-            messages=True,
-            reactions=True,
-            message_content=True,
-            typing=True
-        )
+        trace = bot_global.config.get('trace')
+        self.lean = bot_global.config.get('lean', False)
+        if self.lean:
+            # Only what relaying needs. Members come embedded in messages and reactions or are fetched
+            # on demand, so there is no member list to chunk or keep in memory. Typing is not relayed.
+            intents = discord.Intents(
+                guilds=True,
+                bans=True,
+                messages=True,
+                reactions=True,
+                message_content=True,
+            )
+            kwargs.setdefault('member_cache_flags', discord.MemberCacheFlags.from_intents(intents))
+        else:
+            intents = discord.Intents(
+                guilds=True,
+                members=True,
+                bans=True,
+                emojis=True,
+                voice_states=True,
+                messages=True,
+                reactions=True,
+                message_content=True,
+                typing=True
+            )
+        # Ready no longer waits for every guild to be chunked, linked guilds are chunked afterwards
+        self.lazy_chunking = self.lean or bot_global.config.get('lazy_chunking', False)
+        if self.lazy_chunking:
+            kwargs.setdefault('chunk_guilds_at_startup', False)
         super().__init__(
             command_prefix='^' if not self.debug else '$',
             intents=intents,
@@ -44,31 +68,87 @@ class Wormhole(commands.Bot):
             owner_id=523605852557672449,
             allowed_mentions=allowed_mentions,
             tags=False,
+            # Raw gateway payloads are only dispatched while a trace is being recorded
+            enable_debug_events=trace is not None,
             **kwargs,
         )
         self.boot = datetime.now()
+        # Set on shutdown, new messages stop being relayed while the queued ones are posted
+        self.draining = False
+        self.drain_timeout = bot_global.config.get('drain_timeout', 30)
         self.on_load = []
+        # Every webhook the bot sends through, so echoes can be dropped without any lookups
+        self.webhook_ids: set[int] = set()
+        # Discord allows at most 15 webhooks per channel
+        self.webhook_pool_size = min(max(bot_global.config.get('webhook_pool_size', 1), 1), 15)
+        # Relay traffic runs on its own connection pool instead of the bot's HTTP client
+        self.webhook_client = WebhookClient(allowed_mentions=allowed_mentions, **bot_global.config.get('webhook_client', {}))
+        self.members = MemberLookup(maxsize=bot_global.config.get('member_cache_size', 10000))
+        self.metrics_server: typing.Optional[metrics.MetricsServer] = None
+        if 'metrics' in bot_global.config:
+            self.metrics_server = metrics.MetricsServer(**bot_global.config['metrics'])
+        metrics.gauge('wormhole_db_connections', 'Database pool connections by state.', ('state',), callback=self.pool_connections)
+        self.trace: typing.Optional[TraceRecorder] = None
+        if trace is not None:
+            self.trace = TraceRecorder(trace['path'], anonymize=trace.get('anonymize', False), max_events=trace.get('max_events', 0))
 
     def get_link_cog(self):
         return self.get_cog("Link")
 
     @cache(maxsize=1024)
-    async def get_channel_webhook(self, channel: discord.TextChannel):
-        webhooks = await channel.webhooks()
-        for webhook in webhooks:
-            if webhook.name == 'Wormhole Sender':
-                return webhook
-        return await channel.create_webhook(name='Wormhole Sender')
+    async def get_webhook_pool(self, channel: discord.TextChannel) -> WebhookPool:
+        webhooks = []
+        for webhook in await channel.webhooks():
+            if webhook.name == WEBHOOK_NAME:
+                await self.register_webhook(webhook)
+                webhooks.append(webhook)
+        if not webhooks:
+            webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+            await self.register_webhook(webhook)
+            webhooks.append(webhook)
+        webhooks.sort(key=lambda w: w.id)
+        return WebhookPool(self, channel, webhooks, max_size=self.webhook_pool_size)
+
+    async def get_channel_webhook(self, channel: discord.TextChannel) -> discord.Webhook:
+        return (await self.get_webhook_pool(channel)).primary
+
+    def is_own_webhook(self, webhook_id: typing.Optional[int]) -> bool:
+        return webhook_id is not None and webhook_id in self.webhook_ids
+
+    async def register_webhook(self, webhook: discord.Webhook):
+        if webhook.id in self.webhook_ids:
+            return
+        self.webhook_ids.add(webhook.id)
+        async with db.MaybeAcquire(pool=self.pool) as con:
+            await con.execute(
+                'INSERT INTO webhooks (channel_id, webhook_id) VALUES ($1, $2) ON CONFLICT DO NOTHING;', webhook.channel_id, webhook.id
+            )
+
+    def pool_connections(self) -> dict:
+        if self.pool is None:
+            return {}
+        idle = self.pool.get_idle_size()
+        return {('in_use',): self.pool.get_size() - idle, ('idle',): idle}
+
+    async def load_webhook_ids(self):
+        async with db.MaybeAcquire(pool=self.pool) as con:
+            rows = await con.fetch('SELECT webhook_id FROM webhooks;')
+        self.webhook_ids.update(row['webhook_id'] for row in rows)
 
     async def setup_hook(self) -> None:
-        for extension in startup_extensions:
-            try:
-                await self.load_extension(extension)
-            except (discord.ClientException, ModuleNotFoundError):
-                logging.warning('Failed to load extension {0}.'.format(extension))
-                traceback.print_exc()
+        boot = [self.webhook_client.start(), self.load_webhook_ids()]
+        if self.metrics_server is not None:
+            boot.append(self.metrics_server.start())
+        await asyncio.gather(*boot, *(self.load_startup_extension(extension) for extension in startup_extensions))
         self.loop.create_task(self.run_once_when_ready())
 
+    async def load_startup_extension(self, extension):
+        try:
+            await self.load_extension(extension)
+        except (discord.ClientException, ModuleNotFoundError):
+            logging.warning('Failed to load extension {0}.'.format(extension))
+            traceback.print_exc()
+
     def run(self):
         super().run(bot_global.config['bot_token'], reconnect=True)
 
@@ -78,13 +158,48 @@ class Wormhole(commands.Bot):
     async def start(self) -> None:
         await super().start(bot_global.config['bot_token'], reconnect=True)
 
+    async def close(self) -> None:
+        if not self.draining:
+            self.draining = True
+            link = self.get_link_cog()
+            if link is not None:
+                # Before the HTTP clients close, relays in flight still need them
+                await link.drain(timeout=self.drain_timeout)
+        await super().close()
+        await self.webhook_client.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.trace is not None:
+            self.trace.stop()
+
     async def run_once_when_ready(self):
         await self.wait_until_ready()
-        await self.tree.sync()
+        await self.sync_tree()
         print('Ready!')
+        if self.trace is not None:
+            self.trace.start(await snapshot(self))
         for function in self.on_load:
             await function()
 
+    async def sync_tree(self, *, force=False) -> bool:
+        """Syncs global app commands, unless they are the same as at the last sync."""
+        digest = startup.tree_digest(self.tree)
+        if not force and await startup.get_digest(startup.COMMAND_TREE, pool=self.pool) == digest:
+            logging.info('Command tree unchanged, skipping sync.')
+            return False
+        await self.tree.sync()
+        await startup.set_digest(startup.COMMAND_TREE, digest, pool=self.pool)
+        return True
+
+    async def on_message(self, message: discord.Message):
+        # Authors are the members that get looked up again, for mentions and user info
+        self.members.remember(message.author)
+        await self.process_commands(message)
+
+    async def on_socket_raw_receive(self, payload: str):
+        if self.trace is not None:
+            self.trace.record(payload)
+
     async def on_command_error(self, ctx, error, *, raise_err=True):  # noqa: WPS217
         if isinstance(error, commands.CommandNotFound):
             return
@@ -0,0 +1,63 @@
+import types
+import unittest
+
+from bot.util.attachments import plan_attachments
+
+LIMIT = 100
+
+
+def attachments(*sizes):
+    return [types.SimpleNamespace(id=index, size=size) for index, size in enumerate(sizes)]
+
+
+def ids(group):
+    return [attachment.id for attachment in group]
+
+
+class PlanAttachmentsTest(unittest.TestCase):
+
+    def test_file_exactly_at_limit_is_uploaded(self):
+        plan = plan_attachments(attachments(LIMIT), LIMIT)
+        self.assertEqual([ids(group) for group in plan.uploads], [[0]])
+        self.assertEqual(plan.links, [])
+
+    def test_file_over_limit_is_linked(self):
+        plan = plan_attachments(attachments(LIMIT + 1, 10), LIMIT)
+        self.assertEqual([ids(group) for group in plan.uploads], [[1]])
+        self.assertEqual(ids(plan.links), [0])
+
+    def test_packs_largest_first_within_limit(self):
+        plan = plan_attachments(attachments(30, 60, 50, 40), LIMIT)
+        # 60 + 40 and 50 + 30, each post within the limit, in their original order
+        self.assertEqual([ids(group) for group in plan.uploads], [[1, 3], [0, 2]])
+        self.assertTrue(all(sum(a.size for a in group) <= LIMIT for group in plan.uploads))
+        self.assertEqual(plan.uploaded_bytes, 180)
+
+    def test_eleventh_file_goes_to_another_post(self):
+        plan = plan_attachments(attachments(*[1] * 11), LIMIT)
+        self.assertEqual([len(group) for group in plan.uploads], [10, 1])
+        self.assertEqual(plan.links, [])
+
+    def test_eleventh_file_is_linked_with_one_post(self):
+        plan = plan_attachments(attachments(*[1] * 11), LIMIT, max_posts=1)
+        self.assertEqual([len(group) for group in plan.uploads], [10])
+        self.assertEqual(len(plan.links), 1)
+
+    def test_overflow_past_max_posts_is_linked(self):
+        plan = plan_attachments(attachments(90, 80, 70, 60, 50), LIMIT, max_posts=3)
+        self.assertEqual(len(plan.uploads), 3)
+        self.assertEqual([ids(group) for group in plan.uploads], [[0], [1], [2]])
+        self.assertEqual(ids(plan.links), [3, 4])
+
+    def test_links_keep_message_order(self):
+        plan = plan_attachments(attachments(LIMIT + 5, 90, LIMIT + 1, 95), LIMIT, max_posts=1)
+        self.assertEqual([ids(group) for group in plan.uploads], [[3]])
+        self.assertEqual(ids(plan.links), [0, 1, 2])
+
+    def test_nothing_to_plan(self):
+        plan = plan_attachments([], LIMIT)
+        self.assertEqual((plan.uploads, plan.links), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
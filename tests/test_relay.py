@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import types
+import unittest
+
+from bot.util.relay import RelayItem, RelayQueue
+
+ids = itertools.count(1)
+WEBHOOKER = types.SimpleNamespace(channel=types.SimpleNamespace(id=500))
+
+
+def item(content='hello', *, author=1, source=100, embeds=(), attachments=(), embed=None, append=None) -> RelayItem:
+    message = types.SimpleNamespace(
+        content=content, author=types.SimpleNamespace(id=author), embeds=list(embeds), attachments=list(attachments),
+    )
+    original = types.SimpleNamespace(id=next(ids), channel=types.SimpleNamespace(id=source))
+    return RelayItem(WEBHOOKER, message, original, embed=embed, append=append)
+
+
+class CanMergeTest(unittest.TestCase):
+
+    def test_merges_plain_text_from_the_same_author(self):
+        first, second = item('a'), item('b')
+        self.assertTrue(first.can_merge(second))
+        first.merge(second)
+        self.assertEqual(first.message.content, 'a\nb')
+        self.assertEqual(len(first.originals), 2)
+
+    def test_merged_content_fits_in_one_message(self):
+        first, second = item('a' * 1000), item('b' * 999)
+        self.assertTrue(first.can_merge(second))
+        first.merge(second)
+        self.assertLessEqual(len(first.message.content), 2000)
+        self.assertFalse(item('a' * 1000).can_merge(item('b' * 1000)))
+
+    def test_never_merges_different_authors_or_sources(self):
+        self.assertFalse(item(author=1).can_merge(item(author=2)))
+        self.assertFalse(item(source=100).can_merge(item(source=101)))
+
+    def test_never_merges_rich_messages(self):
+        rich = [
+            item(embeds=[object()]),
+            item(attachments=[object()]),
+            item(embed=object()),
+            item(append='\n-# reply'),
+        ]
+        for other in rich:
+            with self.subTest(other=other):
+                self.assertFalse(item().can_merge(other))
+                self.assertFalse(other.can_merge(item()))
+
+
+class RelayQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_coalesces_while_backed_up(self):
+        release = asyncio.Event()
+        sent = []
+
+        async def send(relay):
+            sent.append(relay.message.content)
+            await release.wait()
+
+        queue = RelayQueue(send, concurrency=1)
+        for content in ('one', 'two', 'three'):
+            queue.put(item(content))
+        queue.put(item('other author', author=2))
+        self.assertEqual(len(queue.pending), 2)
+        release.set()
+        await queue.drain()
+        self.assertEqual(sent, ['one', 'two\nthree', 'other author'])
+        self.assertEqual(queue.active, 0)
+
+    async def test_failed_send_reports_and_starts_the_next_item(self):
+        failures = []
+        sent = []
+
+        async def send(relay):
+            if relay.message.content == 'broken':
+                raise RuntimeError('send failed')
+            sent.append(relay.message.content)
+
+        async def on_failure(relay, error):
+            failures.append((relay.message.content, str(error)))
+
+        queue = RelayQueue(send, concurrency=1, coalesce=False, on_failure=on_failure)
+        with self.assertLogs(level='ERROR'):
+            queue.put(item('broken'))
+            queue.put(item('next'))
+            await queue.drain()
+        self.assertEqual(failures, [('broken', 'send failed')])
+        self.assertEqual(sent, ['next'])
+        self.assertEqual(queue.active, 0)
+        self.assertFalse(queue.pending)
+
+    async def test_failing_on_failure_still_starts_the_next_item(self):
+        sent = []
+
+        async def send(relay):
+            if relay.message.content == 'broken':
+                raise RuntimeError('send failed')
+            sent.append(relay.message.content)
+
+        async def on_failure(relay, error):
+            raise RuntimeError('outbox down')
+
+        queue = RelayQueue(send, concurrency=1, coalesce=False, on_failure=on_failure)
+        with self.assertLogs(level='ERROR'):
+            queue.put(item('broken'))
+            queue.put(item('next'))
+            await queue.drain()
+        self.assertEqual(sent, ['next'])
+        self.assertEqual(queue.active, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+from bot.util.trace import Anonymizer, TraceRecorder, read_trace
+
+
+# A frame as discord.py passes it to socket_raw_receive, before it is parsed
+MESSAGE_CREATE = json.dumps({
+    't': 'MESSAGE_CREATE',
+    's': 5,
+    'op': 0,
+    'd': {'id': '1', 'channel_id': '2', 'guild_id': '3', 'content': 'hello', 'author': {'id': '4', 'username': 'someone'}},
+})
+HEARTBEAT_ACK = json.dumps({'t': None, 's': None, 'op': 11, 'd': None})
+
+
+class TraceRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = pathlib.Path(directory.name) / 'trace.jsonl.gz'
+
+    def test_records_raw_frames(self):
+        recorder = TraceRecorder(self.path)
+        recorder.start({'guilds': []})
+        recorder.record(HEARTBEAT_ACK)
+        recorder.record(MESSAGE_CREATE)
+        recorder.record(MESSAGE_CREATE.encode())
+        recorder.stop()
+
+        header, events = read_trace(self.path)
+        events = list(events)
+        self.assertEqual(header, {'guilds': []})
+        self.assertEqual(recorder.events, 2)
+        self.assertEqual([event['t'] for event in events], ['MESSAGE_CREATE', 'MESSAGE_CREATE'])
+        self.assertEqual(events[0]['d']['content'], 'hello')
+
+    def test_ignores_frames_when_not_recording(self):
+        recorder = TraceRecorder(self.path)
+        recorder.record(MESSAGE_CREATE)
+        self.assertEqual(recorder.events, 0)
+        self.assertFalse(self.path.exists())
+
+
+class AnonymizerTest(unittest.TestCase):
+
+    def test_rewrites_snowflakes_inside_urls(self):
+        anonymizer = Anonymizer()
+        channel_id, attachment_id, user_id = 111111111111111111, 222222222222222222, 333333333333333333
+        scrubbed = anonymizer.scrub({
+            'channel_id': str(channel_id),
+            'author': {'id': str(user_id), 'avatar': 'abc'},
+            'content': 'see https://discord.com/channels/1/{0}/{1}'.format(channel_id, attachment_id),
+            'attachments': [{
+                'id': str(attachment_id),
+                'url': 'https://cdn.discordapp.com/attachments/{0}/{1}/a.png?ex=1&hm=secret'.format(channel_id, attachment_id),
+                'proxy_url': 'https://media.discordapp.net/attachments/{0}/{1}/a.png'.format(channel_id, attachment_id),
+            }],
+            'embeds': [{'thumbnail': {'url': 'https://cdn.discordapp.com/avatars/{0}/abc.png'.format(user_id)}}],
+        })
+        text = json.dumps(scrubbed)
+        for snowflake in (channel_id, attachment_id, user_id):
+            self.assertNotIn(str(snowflake), text)
+        self.assertNotIn('secret', text)
+        # The same id maps to the same replacement wherever it appears
+        new_channel = scrubbed['channel_id']
+        self.assertIn('/attachments/{0}/{1}/a.png'.format(new_channel, scrubbed['attachments'][0]['id']), scrubbed['attachments'][0]['url'])
+        self.assertIn('/avatars/{0}/'.format(scrubbed['author']['id']), scrubbed['embeds'][0]['thumbnail']['url'])
+
+
+if __name__ == '__main__':
+    unittest.main()
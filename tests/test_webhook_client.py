@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+
+import discord
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bot.util.webhook_client import WebhookClient
+
+MESSAGE = {'id': '10', 'channel_id': '20', 'webhook_id': '30'}
+
+
+class WebhookClientTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.responses = []
+        self.requests = []
+        app = web.Application()
+        app.router.add_route('*', '/webhooks/{webhook_id}/{token}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.client = WebhookClient(base_url=str(self.server.make_url('/')))
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.content_type.startswith('multipart/'):
+            parts = {}
+            reader = await request.multipart()
+            async for part in reader:
+                parts[part.name] = (part.filename, await part.read())
+            self.requests.append(parts)
+        else:
+            self.requests.append(await request.json())
+        return self.responses.pop(0)
+
+    async def execute(self, **kwargs):
+        return await self.client.execute(1, 'token', content='hello', **kwargs)
+
+    async def test_success(self):
+        self.responses.append(web.json_response(MESSAGE))
+        response = await self.execute()
+        self.assertEqual((response.id, response.channel_id, response.webhook_id), (10, 20, 30))
+        self.assertEqual(self.requests[0]['content'], 'hello')
+
+    async def test_retries_429_with_retry_after_header(self):
+        self.responses.append(web.Response(status=429, text='slow down', headers={'Retry-After': '0.01'}))
+        self.responses.append(web.json_response(MESSAGE))
+        response = await self.execute()
+        self.assertEqual(response.id, 10)
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_retries_429_with_retry_after_body(self):
+        self.responses.append(web.json_response({'message': 'rate limited', 'retry_after': 0.01, 'global': False}, status=429))
+        self.responses.append(web.json_response(MESSAGE))
+        response = await self.execute()
+        self.assertEqual(response.id, 10)
+        self.assertEqual(len(self.requests), 2)
+
+    async def test_gives_up_after_max_retries(self):
+        self.client.max_retries = 1
+        for _ in range(2):
+            self.responses.append(web.json_response({'message': 'rate limited', 'retry_after': 0.01}, status=429))
+        with self.assertRaises(discord.HTTPException) as raised:
+            await self.execute()
+        self.assertEqual(raised.exception.status, 429)
+
+    async def test_maps_error_statuses(self):
+        cases = [
+            (403, discord.Forbidden),
+            (404, discord.NotFound),
+            (500, discord.DiscordServerError),
+            (503, discord.DiscordServerError),
+            (400, discord.HTTPException),
+        ]
+        for status, expected in cases:
+            with self.subTest(status=status):
+                self.responses.append(web.json_response({'message': 'nope', 'code': 0}, status=status))
+                with self.assertRaises(expected) as raised:
+                    await self.execute()
+                self.assertIs(type(raised.exception), expected)
+                self.assertEqual(raised.exception.status, status)
+                self.assertEqual(raised.exception.text, 'nope')
+
+    async def test_non_json_error_bodies(self):
+        self.responses.append(web.Response(status=502, text='<html>Bad Gateway</html>', content_type='text/html'))
+        with self.assertRaises(discord.DiscordServerError) as raised:
+            await self.execute()
+        self.assertIn('Bad Gateway', raised.exception.text)
+
+        self.responses.append(web.Response(status=413, text='Request Entity Too Large'))
+        with self.assertRaises(discord.HTTPException) as raised:
+            await self.execute()
+        self.assertEqual(raised.exception.status, 413)
+
+    async def test_multipart_files(self):
+        self.responses.append(web.json_response(MESSAGE))
+        files = [
+            discord.File(io.BytesIO(b'first'), filename='a.txt'),
+            discord.File(io.BytesIO(b'second'), filename='b.png', description='a picture'),
+        ]
+        await self.execute(files=files)
+        parts = self.requests[0]
+        self.assertEqual(parts['files[0]'], ('a.txt', b'first'))
+        self.assertEqual(parts['files[1]'], ('b.png', b'second'))
+        payload = json.loads(parts['payload_json'][1])
+        self.assertEqual(payload['content'], 'hello')
+        self.assertEqual(payload['attachments'], [
+            {'id': 0, 'filename': 'a.txt'},
+            {'id': 1, 'filename': 'b.png', 'description': 'a picture'},
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()